@@ -5,40 +5,155 @@ This module handles the initial setup of DSPy, including:
 - Library imports
 - Language model configuration
 - Global DSPy settings
+
+LM responses are cached on disk by DSPy. Set the DSPY_CACHEDIR environment
+variable (before importing dspy) to move the cache to a faster location.
 """
 
 import dspy
+import httpx
+import litellm
+import logging
 import warnings
 import os
+from typing import Dict, Optional
 
 # Suppress warnings for cleaner output
 warnings.filterwarnings('ignore')
 
+# LiteLLM's logging callbacks build a detailed payload for every call, which
+# is a large share of the CPU time of evaluation loops; none are used here
+litellm.success_callback = []
+litellm.failure_callback = []
+litellm._async_success_callback = []
+litellm._async_failure_callback = []
+litellm.callbacks = []
+litellm.turn_off_message_logging = True
+litellm.suppress_debug_info = True
+logging.getLogger("LiteLLM").setLevel(logging.WARNING)
+
+# Language models already built, keyed by their constructor arguments
+_LM_CACHE: Dict[str, dspy.LM] = {}
+
+# Ask Anthropic to cache the system message (signature instructions + demos),
+# which is identical across calls; only the ticket is processed each time.
+ANTHROPIC_PROMPT_CACHING = [{"location": "message", "role": "system"}]
+
+
+def share_http_connections(
+    max_connections: int = 100,
+    max_keepalive_connections: int = 50,
+    timeout: float = 60.0
+) -> None:
+    """
+    Route LiteLLM's synchronous OpenAI/Azure-style requests through one pooled HTTP client.
+
+    litellm.client_session is only read by the OpenAI-compatible and Azure
+    handlers: models on those providers then reuse the same keep-alive
+    connections instead of opening new ones. It has no effect on Ollama
+    (ollama_chat), whose requests go through LiteLLM's own cached HTTP
+    client, which already keeps connections alive within the process.
+    Does nothing if a client is already set. Async requests keep LiteLLM's
+    own clients, since an async connection pool cannot be shared across
+    event loops.
+
+    Args:
+        max_connections: Maximum number of open connections
+        max_keepalive_connections: Maximum number of idle connections kept open
+        timeout: Request timeout in seconds
+    """
+    if litellm.client_session is None:
+        litellm.client_session = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections
+            ),
+            timeout=timeout
+        )
+
+
+def get_lm(**kwargs) -> dspy.LM:
+    """
+    Return a shared dspy.LM for the given settings, creating it on first use.
+
+    Switching back and forth between models reuses the same LM object (and
+    its LiteLLM client) instead of building a new one on every switch.
+    OpenAI/Azure-style models also share the HTTP connection pool set up by
+    share_http_connections().
+
+    Args:
+        **kwargs: Arguments forwarded to dspy.LM (model, temperature, ...)
+
+    Returns:
+        dspy.LM: Language model instance
+    """
+    # repr() so that list/dict arguments can be part of the key
+    key = repr(sorted(kwargs.items()))
+    lm = _LM_CACHE.get(key)
+    if lm is None:
+        share_http_connections()
+        lm = _LM_CACHE[key] = dspy.LM(**kwargs)
+    return lm
+
 
 def configure_ollama(
     model: str = 'ollama_chat/llama3.1:8b',
     api_base: str = 'http://localhost:11434',
-    temperature: float = 0.0
+    temperature: float = 0.0,
+    cache: bool = True,
+    cache_dir: Optional[str] = None,
+    keep_alive: Optional[str] = '30m',
+    num_ctx: Optional[int] = None,
+    max_tokens: Optional[int] = None
 ) -> dspy.LM:
     """
     Configure DSPy to use Ollama with a specified model.
 
+    Responses are cached on disk and in memory, so classifying the same
+    tickets again (baseline, optimized and comparison runs) is immediate.
+
     Args:
         model: The Ollama model to use (e.g., 'ollama_chat/llama3.1:8b')
         api_base: The base URL for the Ollama API
         temperature: Temperature for generation (0.0=deterministic, higher=more creative)
                     For classification tasks, use 0.0 for consistent results.
+        cache: Reuse cached responses for identical prompts
+        cache_dir: Directory of the on-disk response cache (default: DSPy's,
+                   i.e. DSPY_CACHEDIR or ~/.dspy_cache)
+        keep_alive: How long Ollama keeps the model loaded after a request
+                    (e.g. '30m'), so runs a few minutes apart do not pay for
+                    reloading it. None uses the server default (5 minutes).
+        num_ctx: Context window allocated by Ollama (e.g. 1024). Ticket
+                 prompts are short, so a smaller window means a smaller KV
+                 cache. None keeps the model's setting; changing it makes
+                 Ollama reload the model once.
+        max_tokens: Cap on generated tokens (Ollama's num_predict). Leave
+                    room for the reasoning when using ChainOfThought.
 
     Returns:
         dspy.LM: Configured language model
     """
     print(f"🚀 Configuring DSPy with Ollama...")
 
+    if cache_dir:
+        dspy.configure_cache(
+            enable_disk_cache=True,
+            enable_memory_cache=True,
+            disk_cache_dir=cache_dir
+        )
+
     # Configure the language model
-    lm = dspy.LM(
+    extra = {
+        key: value
+        for key, value in (('keep_alive', keep_alive), ('num_ctx', num_ctx), ('max_tokens', max_tokens))
+        if value
+    }
+    lm = get_lm(
         model=model,
         api_base=api_base,
-        temperature=temperature
+        temperature=temperature,
+        cache=cache,
+        **extra
     )
 
     # Set DSPy global configuration
@@ -50,16 +165,19 @@ def configure_ollama(
 
 def configure_openai(
     model: str = 'openai/gpt-4o-mini',
-    temperature: float = 0.3
+    temperature: float = 0.3,
+    cache: bool = True
 ) -> dspy.LM:
     """
     Configure DSPy to use OpenAI models.
 
     Requires OPENAI_API_KEY environment variable to be set.
+    OpenAI caches shared prompt prefixes (1024+ tokens) automatically.
 
     Args:
         model: The OpenAI model to use
         temperature: Temperature for generation
+        cache: Reuse cached responses for identical prompts
 
     Returns:
         dspy.LM: Configured language model
@@ -67,9 +185,10 @@ def configure_openai(
     if not os.getenv('OPENAI_API_KEY'):
         raise ValueError("OPENAI_API_KEY environment variable not set")
 
-    lm = dspy.LM(
+    lm = get_lm(
         model=model,
-        temperature=temperature
+        temperature=temperature,
+        cache=cache
     )
 
     dspy.configure(lm=lm)
@@ -79,7 +198,9 @@ def configure_openai(
 
 def configure_anthropic(
     model: str = 'anthropic/claude-3-5-haiku-20241022',
-    temperature: float = 0.3
+    temperature: float = 0.3,
+    cache: bool = True,
+    prompt_caching: bool = True
 ) -> dspy.LM:
     """
     Configure DSPy to use Anthropic Claude models.
@@ -89,6 +210,10 @@ def configure_anthropic(
     Args:
         model: The Anthropic model to use
         temperature: Temperature for generation
+        cache: Reuse cached responses for identical prompts
+        prompt_caching: Mark the system message as cacheable on Anthropic's side.
+                        Only prefixes of 1024+ tokens are cached (e.g. prompts
+                        with few-shot demos after optimization).
 
     Returns:
         dspy.LM: Configured language model
@@ -96,9 +221,15 @@ def configure_anthropic(
     if not os.getenv('ANTHROPIC_API_KEY'):
         raise ValueError("ANTHROPIC_API_KEY environment variable not set")
 
-    lm = dspy.LM(
+    extra_kwargs = {}
+    if prompt_caching:
+        extra_kwargs['cache_control_injection_points'] = ANTHROPIC_PROMPT_CACHING
+
+    lm = get_lm(
         model=model,
-        temperature=temperature
+        temperature=temperature,
+        cache=cache,
+        **extra_kwargs
     )
 
     dspy.configure(lm=lm)
@@ -110,7 +241,8 @@ def configure_reflection_lm(
     model: str = 'ollama_chat/llama3.1:8b',
     api_base: str = 'http://localhost:11434',
     temperature: float = 1.0,
-    max_tokens: int = 8000
+    max_tokens: int = 8000,
+    cache: bool = False
 ) -> dspy.LM:
     """
     Configure a reflection language model for GEPA optimization.
@@ -125,15 +257,18 @@ def configure_reflection_lm(
         api_base: API base URL (for Ollama)
         temperature: Temperature (higher = more creative)
         max_tokens: Maximum tokens for analysis
+        cache: Reuse cached responses. Disabled by default since reflection
+               runs at high temperature and should produce fresh proposals.
 
     Returns:
         dspy.LM: Configured reflection language model
     """
-    reflection_lm = dspy.LM(
+    reflection_lm = get_lm(
         model=model,
         api_base=api_base,
         temperature=temperature,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        cache=cache
     )
 
     print(f"✅ Reflection LM configured: {model} (temp={temperature}, max_tokens={max_tokens})")
@@ -4,14 +4,16 @@ Data module containing training and validation datasets for IT ticket classifica
 This module defines:
 - Training dataset (trainset)
 - Validation dataset (valset)
-- Categories and priorities constants
+- Columnar views and prebuilt DSPy Examples of both datasets
+- Categories and priorities constants (and derived strings/sets)
 """
 
 import dspy
-from typing import List, Dict
+import difflib
+from typing import List, Dict, Optional, Tuple
 
 # Categories of IT tickets
-CATEGORIES = [
+CATEGORIES = (
     "Hardware",
     "Software",
     "Network",
@@ -20,16 +22,45 @@ CATEGORIES = [
     "Account",
     "Email",
     "Peripherals"
-]
+)
 
 # Priority levels
-PRIORITIES = [
+PRIORITIES = (
     "Low",
     "Medium",
     "High",
     "Urgent",
     "Critical"
-]
+)
+
+# Label lists as shown in prompts and reports
+CATEGORIES_DESC = ', '.join(CATEGORIES)
+PRIORITIES_DESC = ', '.join(PRIORITIES)
+
+# Lowercase label sets for validating model outputs
+CATEGORIES_LC = frozenset(cat.lower() for cat in CATEGORIES)
+PRIORITIES_LC = frozenset(pri.lower() for pri in PRIORITIES)
+
+# Lowercase label -> canonical label (validates and restores casing in one lookup)
+CATEGORY_BY_LC = {cat.lower(): cat for cat in CATEGORIES}
+PRIORITY_BY_LC = {pri.lower(): pri for pri in PRIORITIES}
+
+
+def closest_label(label: str, labels_by_lc: Dict[str, str], cutoff: float = 0.8) -> Optional[str]:
+    """
+    Return the canonical label closest to a misspelled one (None if none is close).
+
+    Args:
+        label: Lowercase label to correct (e.g. 'hardaware')
+        labels_by_lc: CATEGORY_BY_LC or PRIORITY_BY_LC
+        cutoff: Minimum similarity ratio (0 to 1) to accept a match
+
+    Returns:
+        The canonical label, e.g. 'Hardware'
+    """
+    matches = difflib.get_close_matches(label, labels_by_lc.keys(), n=1, cutoff=cutoff)
+    return labels_by_lc[matches[0]] if matches else None
+
 
 # Training dataset
 trainset = [
@@ -62,38 +93,65 @@ valset = [
 ]
 
 
+def _columns(dataset: List[Dict[str, str]]) -> Tuple[Tuple[str, ...], ...]:
+    """Split a list of ticket dicts into (tickets, categories, priorities) tuples."""
+    return tuple(
+        tuple(ex[field] for ex in dataset)
+        for field in ('ticket', 'category', 'priority')
+    )
+
+
+def _build_examples(
+    tickets: Tuple[str, ...],
+    categories: Tuple[str, ...],
+    priorities: Tuple[str, ...]
+) -> Tuple[dspy.Example, ...]:
+    """Build DSPy Examples (with 'ticket' as input field) from label columns."""
+    return tuple(
+        dspy.Example(
+            ticket=ticket,
+            category=category,
+            priority=priority
+        ).with_inputs('ticket')
+        for ticket, category, priority in zip(tickets, categories, priorities)
+    )
+
+
+# Columnar views of the datasets
+TRAIN_TICKETS, TRAIN_CATEGORIES, TRAIN_PRIORITIES = _columns(trainset)
+VAL_TICKETS, VAL_CATEGORIES, VAL_PRIORITIES = _columns(valset)
+
+# DSPy Examples, built once at import
+TRAIN_EXAMPLES = _build_examples(TRAIN_TICKETS, TRAIN_CATEGORIES, TRAIN_PRIORITIES)
+VAL_EXAMPLES = _build_examples(VAL_TICKETS, VAL_CATEGORIES, VAL_PRIORITIES)
+
+
 def get_train_examples() -> List[dspy.Example]:
     """
-    Convert training dataset to DSPy Example format.
+    Return the training dataset in DSPy Example format.
+
+    Each call returns fresh copies of the Examples prebuilt at import, so
+    changes made to them (fields, input keys) do not leak into later runs.
 
     Returns:
         List of DSPy Example objects with 'ticket' as input field
     """
-    return [
-        dspy.Example(
-            ticket=ex['ticket'],
-            category=ex['category'],
-            priority=ex['priority']
-        ).with_inputs('ticket')
-        for ex in trainset
-    ]
+    # with_inputs copies the Example (Example.copy would drop the input keys)
+    return [example.with_inputs('ticket') for example in TRAIN_EXAMPLES]
 
 
 def get_val_examples() -> List[dspy.Example]:
     """
-    Convert validation dataset to DSPy Example format.
+    Return the validation dataset in DSPy Example format.
+
+    Each call returns fresh copies of the Examples prebuilt at import, so
+    changes made to them (fields, input keys) do not leak into later runs.
 
     Returns:
         List of DSPy Example objects with 'ticket' as input field
     """
-    return [
-        dspy.Example(
-            ticket=ex['ticket'],
-            category=ex['category'],
-            priority=ex['priority']
-        ).with_inputs('ticket')
-        for ex in valset
-    ]
+    # with_inputs copies the Example (Example.copy would drop the input keys)
+    return [example.with_inputs('ticket') for example in VAL_EXAMPLES]
 
 
 def print_dataset_stats():
@@ -104,8 +162,8 @@ def print_dataset_stats():
     print(f"   Categories: {len(CATEGORIES)}")
     print(f"   Priorities: {len(PRIORITIES)}")
     print()
-    print(f"Categories: {', '.join(CATEGORIES)}")
-    print(f"Priorities: {', '.join(PRIORITIES)}")
+    print(f"Categories: {CATEGORIES_DESC}")
+    print(f"Priorities: {PRIORITIES_DESC}")
 
 
 if __name__ == "__main__":
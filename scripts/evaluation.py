@@ -5,91 +5,307 @@ This module provides utilities to evaluate and compare DSPy modules
 on datasets using specified metrics.
 """
 
-from typing import Callable, List, Union, Dict
+from typing import Callable, List, Optional, Tuple, Union, Dict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import contextvars
 import dspy
+from metrics import mean_scores
+
+
+def _as_examples(dataset: Union[List[dict], List[dspy.Example]]) -> List[dspy.Example]:
+    """Convert a dataset of dicts to DSPy Examples with 'ticket' as input field."""
+    return [
+        dspy.Example(**example).with_inputs('ticket') if isinstance(example, dict) else example
+        for example in dataset
+    ]
 
 
 def evaluate_module(
     module: dspy.Module,
     dataset: Union[List[dict], List[dspy.Example]],
     metric: Callable,
-    verbose: bool = False
+    verbose: bool = False,
+    num_threads: int = 8,
+    stop_below: Optional[float] = None,
+    display_progress: bool = False
 ) -> float:
     """
     Evaluate a DSPy module on a complete dataset.
 
+    Uses dspy.Evaluate, which runs the examples on a thread pool so that
+    several LM requests are in flight at once.
+
     Args:
         module: The DSPy module to evaluate
         dataset: List of examples (dict or dspy.Example format)
         metric: Metric function that takes (example, prediction) and returns a score
         verbose: If True, print details for each example
+        num_threads: Number of predictions run in parallel
+        stop_below: If set (e.g. a baseline score), stop as soon as the final
+                    score can no longer reach this value (see evaluate_until)
+        display_progress: Show dspy.Evaluate's progress bar
 
     Returns:
-        float: Average score across all examples (between 0 and 1)
+        float: Average score across all examples (between 0 and 1), or across
+               the examples evaluated before stopping
     """
-    total_score = 0
-    n_examples = len(dataset)
+    if stop_below is not None:
+        score, _ = evaluate_until(module, dataset, metric, stop_below, verbose, num_threads)
+        return score
+
+    evaluator = dspy.Evaluate(
+        devset=_as_examples(dataset),
+        metric=metric,
+        num_threads=num_threads,
+        display_progress=display_progress
+    )
+    result = evaluator(module)
+
+    # Optional verbose output
+    if verbose:
+        n_examples = len(result.results)
+        for i, (example, prediction, score) in enumerate(result.results):
+            print(f"Example {i+1}/{n_examples}")
+            print(f"  Ticket: {example.ticket[:50]}...")
+            print(f"  Expected: {example.category} | {example.priority}")
+            print(f"  Predicted: {prediction.get('category')} | {prediction.get('priority')}")
+            print(f"  Score: {score}\n")
 
-    for i, example in enumerate(dataset):
-        # Handle both dict and dspy.Example formats
-        if isinstance(example, dict):
-            ticket = example['ticket']
-        else:
-            ticket = example.ticket
+    # Exact mean: dspy.Evaluate's score is a percentage rounded to 2 decimals,
+    # which would break exact comparisons between models (e.g. ties)
+    if not result.results:
+        return 0.0
+    return sum(score for *_, score in result.results) / len(result.results)
 
-        # Get prediction
-        prediction = module(ticket=ticket)
 
-        # Calculate score
-        score = metric(example, prediction)
-        total_score += score
+def evaluate_until(
+    module: dspy.Module,
+    dataset: Union[List[dict], List[dspy.Example]],
+    metric: Callable,
+    stop_below: float,
+    verbose: bool = False,
+    num_threads: int = 8
+) -> Tuple[float, int]:
+    """
+    Evaluate a module, stopping once it cannot reach a target score.
 
-        # Optional verbose output
-        if verbose:
-            print(f"Example {i+1}/{n_examples}")
-            if isinstance(example, dict):
-                print(f"  Ticket: {example['ticket'][:50]}...")
-                print(f"  Expected: {example['category']} | {example['priority']}")
-            else:
+    Examples run on a thread pool. After each completed example, if the
+    final score could not reach stop_below even with every remaining example
+    scoring 1, the examples not started yet are cancelled. Useful to drop a
+    clearly worse module early when comparing against a baseline.
+
+    Args:
+        module: The DSPy module to evaluate
+        dataset: List of examples (dict or dspy.Example format)
+        metric: Metric function returning a score between 0 and 1
+        stop_below: Target score
+        verbose: If True, print details for each example
+        num_threads: Number of predictions run in parallel
+
+    Returns:
+        Tuple of (average score over the evaluated examples, number evaluated)
+    """
+    examples = _as_examples(dataset)
+    if not examples:
+        return 0.0, 0
+
+    def score(example):
+        try:
+            prediction = module(**example.inputs())
+        except Exception as e:
+            # Failed examples score 0, as with dspy.Evaluate
+            print(f"⚠️ Error on '{example.ticket[:40]}...': {e}")
+            return example, None, 0.0
+        return example, prediction, float(metric(example, prediction))
+
+    # Compare totals rather than averages, with a small tolerance, so that a
+    # module tying the target exactly is not stopped by a rounding error
+    target_total = stop_below * len(examples) - 1e-9
+    total_score = 0.0
+    n_evaluated = 0
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        # Each task gets a copy of the current context (dspy.context settings)
+        futures = [
+            executor.submit(contextvars.copy_context().run, score, example)
+            for example in examples
+        ]
+        for future in as_completed(futures):
+            example, prediction, example_score = future.result()
+            total_score += example_score
+            n_evaluated += 1
+
+            if verbose:
+                print(f"Example {n_evaluated}/{len(examples)}")
                 print(f"  Ticket: {example.ticket[:50]}...")
                 print(f"  Expected: {example.category} | {example.priority}")
-            print(f"  Predicted: {prediction.category} | {prediction.priority}")
-            print(f"  Score: {score}\n")
+                if prediction is not None:
+                    print(f"  Predicted: {prediction.get('category')} | {prediction.get('priority')}")
+                print(f"  Score: {example_score}\n")
+
+            # Best case: every remaining example is a perfect match
+            if total_score + len(examples) - n_evaluated < target_total:
+                for pending in futures:
+                    pending.cancel()
+                if verbose:
+                    print(f"⏹️ Stopped after {n_evaluated}/{len(examples)} examples")
+                break
+
+    return total_score / n_evaluated, n_evaluated
+
+
+async def _stream_exact_match(module: dspy.Module, example: dspy.Example) -> float:
+    """Score one example with exact match, reading the category from the stream."""
+    from metrics import _normalize
+
+    # Listeners keep per-stream state, so each example gets its own wrapper
+    stream = dspy.streamify(
+        module,
+        stream_listeners=[dspy.streaming.StreamListener(signature_field_name='category')],
+        is_async_program=True
+    )(ticket=example.ticket)
+
+    # The stream is always read to the end: leaving it early closes the
+    # streamify generator inside its anyio task group, which then raises a
+    # BaseExceptionGroup(GeneratorExit) that cannot be caught per example
+    category = None
+    prediction = None
+    async for value in stream:
+        if isinstance(value, dspy.streaming.StreamResponse):
+            category = (category or "") + value.chunk
+        elif isinstance(value, dspy.Prediction):
+            prediction = value
+
+    if prediction is None:
+        return 0.0
+
+    # A wrong streamed category decides the score, priority not needed
+    if category is None:
+        category = prediction.category
+    if _normalize(category) != _normalize(example['category']):
+        return 0.0
+    return 1.0 if _normalize(prediction.priority) == _normalize(example['priority']) else 0.0
+
+
+async def aevaluate_exact_match_streaming(
+    module: dspy.Module,
+    dataset: Union[List[dict], List[dspy.Example]],
+    max_concurrency: int = 8
+) -> float:
+    """
+    Evaluate a module with exact match, streaming the LM responses.
+
+    The examples run as tasks on one event loop, and the category is read
+    from the LM stream as it is generated. Each stream is read to the end:
+    dspy.streamify does not support abandoning a stream halfway, so a wrong
+    category does not shorten the request.
+
+    The module must take a 'ticket' input, produce a 'category' output from a
+    single predictor and support async calls (aforward), like
+    SimpleTicketClassifier. Use `await aevaluate_exact_match_streaming(...)`
+    where an event loop is already running (e.g. Jupyter),
+    evaluate_exact_match_streaming elsewhere.
+
+    Args:
+        module: The DSPy module to evaluate
+        dataset: List of examples (dict or dspy.Example format)
+        max_concurrency: Number of examples evaluated concurrently
+
+    Returns:
+        float: Exact-match accuracy (between 0 and 1)
+    """
+    examples = _as_examples(dataset)
+    if not examples:
+        return 0.0
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def score(example):
+        async with semaphore:
+            try:
+                return await _stream_exact_match(module, example)
+            except Exception as e:
+                print(f"⚠️ Error on '{example.ticket[:40]}...': {e}")
+                return 0.0
 
-    # Average score
-    avg_score = total_score / n_examples
-    return avg_score
+    scores = await asyncio.gather(*(score(example) for example in examples))
+    return sum(scores) / len(examples)
+
+
+def evaluate_exact_match_streaming(
+    module: dspy.Module,
+    dataset: Union[List[dict], List[dspy.Example]],
+    max_concurrency: int = 8
+) -> float:
+    """
+    Synchronous version of aevaluate_exact_match_streaming (same arguments and result).
+
+    Raises:
+        RuntimeError: If called while an event loop is running (e.g. in
+                      Jupyter); await aevaluate_exact_match_streaming there instead
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(aevaluate_exact_match_streaming(module, dataset, max_concurrency))
+    raise RuntimeError(
+        "evaluate_exact_match_streaming cannot run inside an event loop (e.g. Jupyter): "
+        "use 'await aevaluate_exact_match_streaming(...)' instead"
+    )
 
 
 def compare_modules(
     modules: List[tuple],
     dataset: Union[List[dict], List[dspy.Example]],
     metrics: Dict[str, Callable],
-    verbose: bool = False
+    verbose: bool = False,
+    num_threads: int = 8,
+    keep_predictions: bool = False
 ) -> List[Dict]:
     """
     Compare multiple modules on a dataset using multiple metrics.
 
+    All (module, example) pairs are predicted in a single parallel run, so
+    requests for different modules overlap too, and every metric is
+    computed on the same predictions instead of one full evaluation per
+    metric.
+
     Args:
         modules: List of (name, module) tuples
         dataset: Dataset to evaluate on
         metrics: Dictionary of {metric_name: metric_function}
         verbose: If True, print progress
+        num_threads: Number of predictions run in parallel
+        keep_predictions: If True, also return each module's predictions
+                          (aligned with the dataset, None for failures)
+                          under the 'predictions' key, so they can be reused
 
     Returns:
         List of dictionaries containing results for each module
     """
+    examples = _as_examples(dataset)
     results = []
 
-    for name, module in modules:
-        if verbose:
-            print(f"Evaluating {name}...")
+    if verbose:
+        print(f"Evaluating {', '.join(name for name, _ in modules)}...")
+
+    # One parallel run over every (module, example) pair
+    parallel = dspy.Parallel(num_threads=num_threads, disable_progress_bar=True)
+    all_predictions = parallel([
+        (module, example.inputs())
+        for _, module in modules
+        for example in examples
+    ])
 
+    for i, (name, _) in enumerate(modules):
+        predictions = all_predictions[i * len(examples):(i + 1) * len(examples)]
+        # Failed examples come back as None and score 0
         module_results = {'module': name}
+        module_results.update(mean_scores(examples, predictions, metrics))
 
-        for metric_name, metric_func in metrics.items():
-            score = evaluate_module(module, dataset, metric_func, verbose=False)
-            module_results[metric_name] = score
+        if keep_predictions:
+            module_results['predictions'] = predictions
 
         results.append(module_results)
 
@@ -120,21 +336,23 @@ def print_comparison_table(results: List[Dict], metric_names: List[str]):
     print(header)
     print("-" * len(header))
 
-    # Print data rows
+    # Print data rows, tracking the best module for each metric on the way
+    # (the first module wins ties)
+    best = {}
     for result in results:
         row = f"{result['module']:<{name_width}}"
         for metric_name in metric_names:
             score = result.get(metric_name, 0)
             row += f" | {score:<{metric_width}.1%}"
+            if metric_name not in best or score > best[metric_name][1]:
+                best[metric_name] = (result['module'], score)
         print(row)
 
     print("=" * 70)
 
-    # Find best module for each metric
     print("\nBest performers:")
-    for metric_name in metric_names:
-        best = max(results, key=lambda x: x.get(metric_name, 0))
-        print(f"  {metric_name}: {best['module']} ({best[metric_name]:.1%})")
+    for metric_name, (module_name, score) in best.items():
+        print(f"  {metric_name}: {module_name} ({score:.1%})")
 
 
 if __name__ == "__main__":
@@ -8,8 +8,8 @@ to build complete workflows.
 import dspy
 from config import configure_ollama, configure_reflection_lm
 from data import get_train_examples, get_val_examples, valset
-from modules import SimpleTicketClassifier
-from metrics import exact_match_metric, partial_match_metric
+from modules import SimpleTicketClassifier, classify_batch
+from metrics import exact_match_metric, partial_match_metric, relative_improvement
 from evaluation import evaluate_module, compare_modules, print_comparison_table
 from optimizers import optimize_with_bootstrap, inspect_optimized_demos
 from gepa_utils import optimize_with_gepa, inspect_gepa_prompts
@@ -40,8 +40,10 @@ def example_1_basic_usage():
         "Toutes les imprimantes de l'étage sont hors ligne"
     ]
 
-    for i, ticket in enumerate(test_tickets, 1):
-        result = classifier(ticket=ticket)
+    # All tickets are sent at once and decoded in parallel
+    results = classify_batch(classifier, test_tickets)
+
+    for i, (ticket, result) in enumerate(zip(test_tickets, results), 1):
         print(f"{i}. {ticket[:60]}...")
         print(f"   → Category: {result.category}")
         print(f"   → Priority: {result.priority}\n")
@@ -110,7 +112,7 @@ def example_3_optimization():
     print(f"   Score: {score_after:.2%}")
 
     # Show improvement
-    improvement = ((score_after - score_before) / score_before * 100) if score_before > 0 else 0
+    improvement = relative_improvement(score_before, score_after)
     print(f"   Improvement: {improvement:+.1f}%\n")
 
     # Inspect demos
@@ -158,7 +160,7 @@ def example_4_gepa_optimization():
     print(f"   Score: {score_after:.2%}")
 
     # Show improvement
-    improvement = ((score_after - score_before) / score_before * 100) if score_before > 0 else 0
+    improvement = relative_improvement(score_before, score_after)
     print(f"   Improvement: {improvement:+.1f}%\n")
 
     # Inspect GEPA optimizations
@@ -5,9 +5,42 @@ This module provides utilities for optimizing DSPy modules using GEPA
 (Genetic-Pareto Algorithm), the most sophisticated optimizer in DSPy.
 """
 
-from dspy.teleprompt import GEPA
 import dspy
-from typing import Callable, List
+import inspect
+import textwrap
+from functools import lru_cache
+from itertools import islice
+from typing import Callable, FrozenSet, List, Optional
+
+# `import dspy` already loads dspy.teleprompt, so this import costs nothing
+# extra; the guard only covers DSPy versions without GEPA
+try:
+    from dspy.teleprompt import GEPA
+except ImportError:
+    GEPA = None
+
+
+@lru_cache(maxsize=1)
+def _gepa_parameters() -> FrozenSet[str]:
+    """
+    Return the keyword arguments accepted by the installed GEPA optimizer.
+
+    GEPA's constructor changes between DSPy releases; introspecting it once
+    lets us drop unsupported options instead of trial-constructing it.
+    """
+    return frozenset(inspect.signature(GEPA.__init__).parameters) - {'self'}
+
+
+def _deduplicate(examples: List[dspy.Example]) -> List[dspy.Example]:
+    """Drop examples whose ticket (case and whitespace aside) and labels repeat an earlier one."""
+    seen = set()
+    unique = []
+    for example in examples:
+        key = (' '.join(example.ticket.lower().split()), example.category, example.priority)
+        if key not in seen:
+            seen.add(key)
+            unique.append(example)
+    return unique
 
 
 def optimize_with_gepa(
@@ -15,8 +48,13 @@ def optimize_with_gepa(
     trainset: List[dspy.Example],
     valset: List[dspy.Example],
     metric: Callable,
-    reflection_lm: dspy.LM,
-    auto: str = 'light'
+    reflection_lm: Optional[dspy.LM] = None,
+    auto: str = 'light',
+    num_threads: int = 8,
+    max_metric_calls: Optional[int] = None,
+    reflection_minibatch_size: int = 3,
+    dedup: bool = True,
+    **gepa_kwargs
 ) -> dspy.Module:
     """
     Optimize a module using GEPA.
@@ -29,8 +67,22 @@ def optimize_with_gepa(
         trainset: Training examples
         valset: Validation examples (for preventing overfitting)
         metric: Metric function (must be compatible with GEPA)
-        reflection_lm: Language model for error analysis
+        reflection_lm: Language model for error analysis (default: the shared
+                       LM returned by configure_reflection_lm(), reused
+                       across GEPA runs in the same process)
         auto: Optimization level ('light', 'medium', or 'heavy')
+        num_threads: Number of examples evaluated in parallel for each candidate.
+                     Keep it at or below OLLAMA_NUM_PARALLEL for local models;
+                     hosted APIs can go higher (e.g. 32).
+        max_metric_calls: Explicit budget of metric calls. Overrides auto and
+                          keeps the cost predictable: on a small trainset,
+                          100-200 calls are usually enough.
+        reflection_minibatch_size: Number of examples shown to the reflection
+                                   LM per proposal (1-3 is enough)
+        dedup: Remove duplicate training tickets first, so that GEPA does not
+               spend rollouts and reflection calls on the same example twice
+        **gepa_kwargs: Extra GEPA options. Options not supported by the
+                       installed DSPy version are skipped with a warning.
 
     Returns:
         Optimized module
@@ -41,7 +93,10 @@ def optimize_with_gepa(
     - 'heavy': 20-40 minutes, ~800-1600 LLM calls, 20-30% improvement
     """
     print("=" * 70)
-    print(f"🧬 OPTIMIZING WITH GEPA - MODE '{auto.upper()}'")
+    if max_metric_calls:
+        print(f"🧬 OPTIMIZING WITH GEPA - BUDGET OF {max_metric_calls} METRIC CALLS")
+    else:
+        print(f"🧬 OPTIMIZING WITH GEPA - MODE '{auto.upper()}'")
     print("=" * 70)
     print()
 
@@ -52,14 +107,41 @@ def optimize_with_gepa(
         'heavy': '20-40 minutes'
     }
 
-    print(f"⏰ Estimated time: {time_estimates.get(auto, 'unknown')}")
+    if not max_metric_calls:
+        print(f"⏰ Estimated time: {time_estimates.get(auto, 'unknown')}")
     print("☕ This is a good time for a coffee break!\n")
 
+    if dedup:
+        n_before = len(trainset)
+        trainset = _deduplicate(trainset)
+        if len(trainset) < n_before:
+            print(f"🧹 Removed {n_before - len(trainset)} duplicate training examples\n")
+
+    if reflection_lm is None:
+        from config import configure_reflection_lm
+        reflection_lm = configure_reflection_lm()
+
     # Configure GEPA optimizer
+    if GEPA is None:
+        print("❌ GEPA is not available in this DSPy version (requires dspy-ai>=3.0)")
+        raise ImportError("dspy.teleprompt.GEPA not found")
+
+    accepted = _gepa_parameters()
+    unsupported = sorted(set(gepa_kwargs) - accepted)
+    if unsupported:
+        print(f"⚠️ Ignoring GEPA options not supported by this DSPy version: {', '.join(unsupported)}\n")
+
+    # GEPA accepts exactly one budget: auto or max_metric_calls
+    budget = {'max_metric_calls': max_metric_calls} if max_metric_calls else {'auto': auto}
+
     optimizer = GEPA(
         metric=metric,
-        auto=auto,
-        reflection_lm=reflection_lm
+        reflection_lm=reflection_lm,
+        num_threads=num_threads,
+        reflection_minibatch_size=reflection_minibatch_size,
+        candidate_selection_strategy='pareto',
+        **budget,
+        **{k: v for k, v in gepa_kwargs.items() if k in accepted}
     )
 
     try:
@@ -127,12 +209,13 @@ def inspect_gepa_prompts(optimized_module: dspy.Module):
         print("=" * 70)
         print("📚 DEMONSTRATION EXAMPLES")
         print("=" * 70)
-        print(f"Number of examples: {len(predictor.demos)}\n")
+        n_demos = len(predictor.demos)
+        print(f"Number of examples: {n_demos}\n")
 
         # Show first 3 examples
-        for i, demo in enumerate(predictor.demos[:3], 1):
+        for i, demo in enumerate(islice(predictor.demos, 3), 1):
             print(f"Example {i}:")
-            print(f"  Ticket: {demo.ticket[:80]}...")
+            print(f"  Ticket: {textwrap.shorten(demo.ticket, width=80, placeholder='...')}")
             if hasattr(demo, 'category'):
                 print(f"  Category: {demo.category}")
             if hasattr(demo, 'priority'):
@@ -214,7 +297,7 @@ if __name__ == "__main__":
     from config import configure_ollama, configure_reflection_lm
     from modules import SimpleTicketClassifier
     from data import get_train_examples, get_val_examples
-    from metrics import exact_match_metric
+    from metrics import exact_match_metric, relative_improvement
     from evaluation import evaluate_module
 
     print("Testing GEPA utilities...\n")
@@ -251,7 +334,7 @@ if __name__ == "__main__":
     print(f"   GEPA score: {score_after:.2%}")
 
     # Calculate improvement
-    improvement = ((score_after - score_before) / score_before * 100) if score_before > 0 else 0
+    improvement = relative_improvement(score_before, score_after)
     print(f"   Improvement: {improvement:+.1f}%\n")
 
     # Inspect optimizations
@@ -4,8 +4,51 @@ Evaluation metrics for IT ticket classification.
 This module provides various metrics to evaluate model performance:
 - Exact match: Both category and priority must be correct
 - Partial match: Gives partial credit if one field is correct
+- Feedback metric: Partial match plus a textual explanation for GEPA
 """
 
+import dspy
+import numpy as np
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+
+
+@lru_cache(maxsize=1024)
+def _normalize(label: str) -> str:
+    """
+    Normalize a label for comparison (lowercase, no surrounding spaces).
+
+    Memoized: optimizers call the metrics thousands of times on the same
+    handful of labels.
+    """
+    return label.strip().lower()
+
+
+def _raw_labels(example) -> Tuple[str, str]:
+    """Return the (category, priority) of a dict or dspy.Example, as is."""
+    # dspy.Example supports item access too, so no type check is needed
+    return example['category'], example['priority']
+
+
+@lru_cache(maxsize=4096)
+def _label_matches(
+    pred_category: str,
+    pred_priority: str,
+    true_category: str,
+    true_priority: str
+) -> Tuple[bool, bool]:
+    """
+    Return (category_match, priority_match) for raw predicted and expected labels.
+
+    Memoized on the raw strings: optimizers such as GEPA score the same
+    (prediction, expected) pairs over and over, and a single cache lookup
+    replaces the four normalizations and comparisons.
+    """
+    return (
+        _normalize(pred_category) == _normalize(true_category),
+        _normalize(pred_priority) == _normalize(true_priority)
+    )
+
 
 def exact_match_metric(example, prediction, trace=None, pred_name=None, pred_trace=None):
     """
@@ -21,18 +64,10 @@ def exact_match_metric(example, prediction, trace=None, pred_name=None, pred_tra
     Returns:
         float: 1.0 if exact match, 0.0 otherwise
     """
-    # Normalize strings (lowercase, no spaces)
-    pred_category = prediction.category.strip().lower()
-    true_category = example['category'].strip().lower() if isinstance(example, dict) else example.category.strip().lower()
-
-    pred_priority = prediction.priority.strip().lower()
-    true_priority = example['priority'].strip().lower() if isinstance(example, dict) else example.priority.strip().lower()
-
-    # Both must be correct
-    if pred_category == true_category and pred_priority == true_priority:
-        return 1.0
-    else:
+    # Both must be correct: a wrong category decides it, priority not needed
+    if _normalize(prediction.category) != _normalize(example['category']):
         return 0.0
+    return 1.0 if _normalize(prediction.priority) == _normalize(example['priority']) else 0.0
 
 
 def partial_match_metric(example, prediction, trace=None, pred_name=None, pred_trace=None):
@@ -53,24 +88,164 @@ def partial_match_metric(example, prediction, trace=None, pred_name=None, pred_t
     Returns:
         float: Score between 0.0 and 1.0
     """
-    # Normalize strings
-    pred_category = prediction.category.strip().lower()
-    true_category = example['category'].strip().lower() if isinstance(example, dict) else example.category.strip().lower()
+    category_match, priority_match = _label_matches(
+        prediction.category, prediction.priority, *_raw_labels(example)
+    )
+    return _partial_score(category_match, priority_match)
+
+
+def _partial_score(category_match: bool, priority_match: bool) -> float:
+    """Partial-match score from the two label comparisons."""
+    # Category is more important: it decides the score band
+    if category_match:
+        return 1.0 if priority_match else 0.7
+    return 0.5 if priority_match else 0.0
+
 
-    pred_priority = prediction.priority.strip().lower()
-    true_priority = example['priority'].strip().lower() if isinstance(example, dict) else example.priority.strip().lower()
+def _label_array(labels: List[str]) -> np.ndarray:
+    """Normalize a list of labels into a NumPy string array (missing labels become '')."""
+    return np.char.lower(np.char.strip(np.array([label or '' for label in labels], dtype=str)))
 
-    category_match = (pred_category == true_category)
-    priority_match = (pred_priority == true_priority)
 
-    if category_match and priority_match:
-        return 1.0
-    elif category_match:
-        return 0.7  # Category is more important
-    elif priority_match:
-        return 0.5
+def batch_scores(examples: List, predictions: List) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score a whole set of predictions at once (vectorized with NumPy).
+
+    Gives the same per-example results as exact_match_metric and
+    partial_match_metric, computed with array operations instead of one
+    Python call per example.
+
+    Args:
+        examples: Ground truth examples (dict or dspy.Example)
+        predictions: Model predictions, aligned with the examples
+
+    Returns:
+        Tuple of (exact_scores, partial_scores) arrays, one score per example
+    """
+    true_categories = _label_array([example['category'] for example in examples])
+    true_priorities = _label_array([example['priority'] for example in examples])
+    pred_categories = _label_array([prediction.category for prediction in predictions])
+    pred_priorities = _label_array([prediction.priority for prediction in predictions])
+
+    category_match = pred_categories == true_categories
+    priority_match = pred_priorities == true_priorities
+
+    exact_scores = (category_match & priority_match).astype(float)
+    partial_scores = np.where(
+        category_match,
+        np.where(priority_match, 1.0, 0.7),
+        np.where(priority_match, 0.5, 0.0)
+    )
+    return exact_scores, partial_scores
+
+
+def mean_score(examples: List, predictions: List, metric) -> float:
+    """
+    Average a metric over aligned examples and predictions.
+
+    exact_match_metric and partial_match_metric are computed in one
+    vectorized pass with batch_scores; any other metric is called once per
+    example. Missing predictions (None) score 0.
+
+    Args:
+        examples: Ground truth examples (dict or dspy.Example)
+        predictions: Model predictions, aligned with the examples
+        metric: Metric function taking (example, prediction)
+
+    Returns:
+        float: Average score (0.0 for an empty dataset)
+    """
+    return mean_scores(examples, predictions, {'score': metric})['score']
+
+
+def mean_scores(examples: List, predictions: List, metrics: Dict[str, Callable]) -> Dict[str, float]:
+    """
+    Average several metrics over the same examples and predictions.
+
+    Like mean_score, but exact_match_metric and partial_match_metric share a
+    single batch_scores pass, since both come from the same label comparisons.
+
+    Args:
+        examples: Ground truth examples (dict or dspy.Example)
+        predictions: Model predictions, aligned with the examples
+        metrics: Dictionary of {metric_name: metric_function}
+
+    Returns:
+        Dictionary of {metric_name: average score}
+    """
+    if not examples:
+        return {name: 0.0 for name in metrics}
+
+    vectorized = None
+    results = {}
+    for name, metric in metrics.items():
+        if metric is exact_match_metric or metric is partial_match_metric:
+            if vectorized is None:
+                filled = [
+                    prediction if prediction is not None else dspy.Prediction(category='', priority='')
+                    for prediction in predictions
+                ]
+                vectorized = batch_scores(examples, filled)
+            scores = vectorized[0] if metric is exact_match_metric else vectorized[1]
+            results[name] = float(scores.mean())
+        else:
+            total = sum(
+                metric(example, prediction)
+                for example, prediction in zip(examples, predictions)
+                if prediction is not None
+            )
+            results[name] = total / len(examples)
+    return results
+
+
+def relative_improvement(before: float, after: float) -> float:
+    """
+    Relative change of a score, in percent (0 when there is no baseline score).
+
+    Args:
+        before: Score before optimization
+        after: Score after optimization
+
+    Returns:
+        float: Improvement in percent (negative for a regression)
+    """
+    return (after - before) / before * 100 if before > 0 else 0.0
+
+
+def partial_match_feedback_metric(example, prediction, trace=None, pred_name=None, pred_trace=None):
+    """
+    Partial match metric that also explains the score, for GEPA.
+
+    GEPA's reflection LM reads the feedback to understand what went wrong,
+    which makes its proposals more targeted than with a bare score.
+
+    Args:
+        example: Ground truth example
+        prediction: Model prediction
+        trace: Optional trace information (for GEPA compatibility)
+        pred_name: Optional predictor name (for GEPA compatibility)
+        pred_trace: Optional prediction trace (for GEPA compatibility)
+
+    Returns:
+        dspy.Prediction: score (same as partial_match_metric) and feedback
+    """
+    true_category, true_priority = _raw_labels(example)
+    category_match, priority_match = _label_matches(
+        prediction.category, prediction.priority, true_category, true_priority
+    )
+    score = _partial_score(category_match, priority_match)
+
+    feedback = []
+    if category_match:
+        feedback.append(f"Category '{prediction.category}' is correct.")
     else:
-        return 0.0
+        feedback.append(f"Category '{prediction.category}' is wrong, expected '{true_category}'.")
+    if priority_match:
+        feedback.append(f"Priority '{prediction.priority}' is correct.")
+    else:
+        feedback.append(f"Priority '{prediction.priority}' is wrong, expected '{true_priority}'.")
+
+    return dspy.Prediction(score=score, feedback=" ".join(feedback))
 
 
 def category_only_metric(example, prediction, trace=None, pred_name=None, pred_trace=None):
@@ -87,10 +262,7 @@ def category_only_metric(example, prediction, trace=None, pred_name=None, pred_t
     Returns:
         float: 1.0 if category correct, 0.0 otherwise
     """
-    pred_category = prediction.category.strip().lower()
-    true_category = example['category'].strip().lower() if isinstance(example, dict) else example.category.strip().lower()
-
-    return 1.0 if pred_category == true_category else 0.0
+    return 1.0 if _normalize(prediction.category) == _normalize(example['category']) else 0.0
 
 
 def priority_only_metric(example, prediction, trace=None, pred_name=None, pred_trace=None):
@@ -107,16 +279,11 @@ def priority_only_metric(example, prediction, trace=None, pred_name=None, pred_t
     Returns:
         float: 1.0 if priority correct, 0.0 otherwise
     """
-    pred_priority = prediction.priority.strip().lower()
-    true_priority = example['priority'].strip().lower() if isinstance(example, dict) else example.priority.strip().lower()
-
-    return 1.0 if pred_priority == true_priority else 0.0
+    return 1.0 if _normalize(prediction.priority) == _normalize(example['priority']) else 0.0
 
 
 if __name__ == "__main__":
     # Test metrics
-    import dspy
-
     print("Testing metrics...\n")
 
     # Mock example and predictions
@@ -142,3 +309,6 @@ if __name__ == "__main__":
     print("\nTest 4: Both wrong")
     print(f"  Exact match: {exact_match_metric(example, pred_wrong)}")
     print(f"  Partial match: {partial_match_metric(example, pred_wrong)}")
+
+    print("\nTest 5: Feedback for GEPA")
+    print(f"  {partial_match_feedback_metric(example, pred_cat_only).feedback}")
@@ -4,13 +4,38 @@ DSPy Modules for IT ticket classification.
 This module contains various DSPy module implementations:
 - Simple modules (Predict, ChainOfThought)
 - Composed modules (Sequential, Validated, Ensemble)
+- Batch module (several tickets per LM call)
 """
 
 import dspy
-from typing import List
-from collections import Counter
-from signatures import TicketClassifier, CategoryClassifier, PriorityClassifier
-from data import CATEGORIES, PRIORITIES
+import asyncio
+import contextvars
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional
+from signatures import TicketClassifier, CategoryClassifier, PriorityClassifier, BatchClassifier
+from data import (
+    CATEGORIES_LC, PRIORITIES_LC, CATEGORY_BY_LC, PRIORITY_BY_LC, closest_label,
+    TRAIN_CATEGORIES, TRAIN_PRIORITIES
+)
+
+
+@lru_cache(maxsize=None)
+def _cot_prototype(signature, config_items: tuple) -> dspy.ChainOfThought:
+    """Build a ChainOfThought predictor once per signature and config."""
+    return dspy.ChainOfThought(signature, **dict(config_items))
+
+
+def _chain_of_thought(signature, **config) -> dspy.ChainOfThought:
+    """
+    Return a new ChainOfThought predictor for the signature.
+
+    Building a ChainOfThought derives a new signature class with the
+    reasoning field, so it is done once per signature and config; each call
+    returns a deep copy, with its own demos and state.
+    """
+    return _cot_prototype(signature, tuple(sorted(config.items()))).deepcopy()
 
 
 class SimpleTicketClassifier(dspy.Module):
@@ -20,9 +45,18 @@ class SimpleTicketClassifier(dspy.Module):
     This is the baseline module used throughout the tutorial.
     """
 
-    def __init__(self):
+    def __init__(self, use_cot: bool = True, max_tokens: Optional[int] = None):
+        """
+        Args:
+            use_cot: Use ChainOfThought (True) or plain Predict (False).
+                     Predict skips the reasoning and emits only the two labels,
+                     which is much faster when the reasoning is not needed.
+            max_tokens: Optional cap on generated tokens per call
+        """
         super().__init__()
-        self.classifier = dspy.ChainOfThought(TicketClassifier)
+        predictor = _chain_of_thought if use_cot else dspy.Predict
+        config = {'max_tokens': max_tokens} if max_tokens else {}
+        self.classifier = predictor(TicketClassifier, **config)
 
     def forward(self, ticket):
         result = self.classifier(ticket=ticket)
@@ -31,6 +65,33 @@ class SimpleTicketClassifier(dspy.Module):
             priority=result.priority
         )
 
+    async def aforward(self, ticket):
+        result = await self.classifier.acall(ticket=ticket)
+        return dspy.Prediction(
+            category=result.category,
+            priority=result.priority
+        )
+
+
+def _priority_prior(min_share: float, min_support: int) -> Dict[str, str]:
+    """
+    Map each category to its dominant priority in the training set.
+
+    Only categories with at least min_support tickets whose most frequent
+    priority covers at least min_share of them are included.
+    """
+    by_category = defaultdict(Counter)
+    for category, priority in zip(TRAIN_CATEGORIES, TRAIN_PRIORITIES):
+        by_category[category.lower()][priority] += 1
+
+    prior = {}
+    for category, counts in by_category.items():
+        total = sum(counts.values())
+        priority, count = counts.most_common(1)[0]
+        if total >= min_support and count / total >= min_share:
+            prior[category] = priority
+    return prior
+
 
 class SequentialClassifier(dspy.Module):
     """
@@ -40,15 +101,36 @@ class SequentialClassifier(dspy.Module):
     feeds into the input of another.
     """
 
-    def __init__(self):
+    def __init__(self, prior_confidence: Optional[float] = None, min_support: int = 3):
+        """
+        Args:
+            prior_confidence: If set, skip the priority LM call for categories
+                              whose training tickets share the same priority
+                              at least this often (e.g. 0.8), and use that
+                              priority directly. Saves a call per such ticket
+                              at the cost of some priority accuracy.
+            min_support: Minimum number of training tickets in a category
+                         before its priority prior is trusted
+        """
         super().__init__()
-        self.category_predictor = dspy.ChainOfThought(CategoryClassifier)
-        self.priority_predictor = dspy.ChainOfThought(PriorityClassifier)
+        self.category_predictor = _chain_of_thought(CategoryClassifier)
+        self.priority_predictor = _chain_of_thought(PriorityClassifier)
+        self.priority_prior = (
+            _priority_prior(prior_confidence, min_support) if prior_confidence else {}
+        )
 
     def forward(self, ticket):
         # Step 1: Predict category
         category_result = self.category_predictor(ticket=ticket)
 
+        # Shortcut: the category almost always comes with the same priority
+        prior_priority = self.priority_prior.get(category_result.category.strip().lower())
+        if prior_priority:
+            return dspy.Prediction(
+                category=category_result.category,
+                priority=prior_priority
+            )
+
         # Step 2: Predict priority using the category
         priority_result = self.priority_predictor(
             ticket=ticket,
@@ -66,30 +148,35 @@ class ValidatedClassifier(dspy.Module):
     Classifier with output validation.
 
     Validates that outputs are within the expected categories and priorities.
-    Corrects invalid outputs automatically.
+    Corrects invalid outputs automatically: near-misses (e.g. 'Aplication')
+    are mapped to the closest label, anything else to a default.
     """
 
     def __init__(self):
         super().__init__()
-        self.classifier = dspy.ChainOfThought(TicketClassifier)
-        self.valid_categories = set(cat.lower() for cat in CATEGORIES)
-        self.valid_priorities = set(pri.lower() for pri in PRIORITIES)
+        self.classifier = _chain_of_thought(TicketClassifier)
+        # Lowercase label -> canonical label
+        self.valid_categories = CATEGORY_BY_LC
+        self.valid_priorities = PRIORITY_BY_LC
 
     def forward(self, ticket):
         # Get prediction
         result = self.classifier(ticket=ticket)
 
-        # Validate category
-        category = result.category.strip()
-        if category.lower() not in self.valid_categories:
-            print(f"⚠️ Invalid category '{category}', correcting...")
-            category = "Application"  # Default fallback
-
-        # Validate priority
-        priority = result.priority.strip()
-        if priority.lower() not in self.valid_priorities:
-            print(f"⚠️ Invalid priority '{priority}', correcting...")
-            priority = "Medium"  # Default fallback
+        # Validate category (and snap it to the canonical label)
+        raw_category = result.category.strip().lower()
+        category = self.valid_categories.get(raw_category)
+        if category is None:
+            print(f"⚠️ Invalid category '{result.category.strip()}', correcting...")
+            # Closest label for a typo, default fallback otherwise
+            category = closest_label(raw_category, self.valid_categories) or "Application"
+
+        # Validate priority (and snap it to the canonical label)
+        raw_priority = result.priority.strip().lower()
+        priority = self.valid_priorities.get(raw_priority)
+        if priority is None:
+            print(f"⚠️ Invalid priority '{result.priority.strip()}', correcting...")
+            priority = closest_label(raw_priority, self.valid_priorities) or "Medium"
 
         return dspy.Prediction(
             category=category,
@@ -103,32 +190,60 @@ class EnsembleClassifier(dspy.Module):
 
     Combines predictions from multiple classifiers and returns
     the most common prediction (majority vote).
+
+    The members share a single ChainOfThought predictor and differ by their
+    sampling temperature (spread between 0.3 and 0.9), which is what makes
+    their answers diverse.
     """
 
     def __init__(self, n_models: int = 3):
         """
         Args:
-            n_models: Number of classifier instances to use
+            n_models: Number of ensemble members (one LM call per member)
         """
         super().__init__()
-        self.classifiers = [
-            dspy.ChainOfThought(TicketClassifier)
-            for _ in range(n_models)
+        self.classifier = _chain_of_thought(TicketClassifier)
+        self.temperatures = [
+            round(0.3 + 0.6 * i / max(n_models - 1, 1), 2)
+            for i in range(n_models)
         ]
 
     def forward(self, ticket):
-        # Collect predictions from all models
-        categories = []
-        priorities = []
-
-        for classifier in self.classifiers:
-            result = classifier(ticket=ticket)
-            categories.append(result.category)
-            priorities.append(result.priority)
-
-        # Majority vote
-        category_vote = Counter(categories).most_common(1)[0][0]
-        priority_vote = Counter(priorities).most_common(1)[0][0]
+        def ask(temperature):
+            try:
+                return self.classifier(ticket=ticket, config={'temperature': temperature})
+            except Exception as e:
+                print(f"⚠️ Ensemble member (temperature {temperature}) failed: {e}")
+                return None
+
+        # Collect predictions from all members, queried concurrently. A plain
+        # thread pool rather than dspy.Parallel: nested in dspy.Evaluate
+        # workers, dspy.Parallel's progress bookkeeping can crash the whole
+        # evaluation. Each task gets a copy of the current context
+        # (dspy.context settings)
+        with ThreadPoolExecutor(max_workers=len(self.temperatures)) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, ask, temperature)
+                for temperature in self.temperatures
+            ]
+            results = [future.result() for future in futures]
+
+        # Majority vote, tallied in a single pass
+        # (failed calls come back as None and are left out of the vote)
+        category_counts = {}
+        priority_counts = {}
+        for result in results:
+            if result is None:
+                continue
+            category_counts[result.category] = category_counts.get(result.category, 0) + 1
+            priority_counts[result.priority] = priority_counts.get(result.priority, 0) + 1
+
+        if not category_counts:
+            raise Exception("No model could make a prediction")
+
+        # Ties go to the first label seen, as with Counter.most_common
+        category_vote = max(category_counts, key=category_counts.get)
+        priority_vote = max(priority_counts, key=priority_counts.get)
 
         return dspy.Prediction(
             category=category_vote,
@@ -136,6 +251,44 @@ class EnsembleClassifier(dspy.Module):
         )
 
 
+class BatchTicketClassifier(dspy.Module):
+    """
+    Classifier that packs several tickets into a single LM call.
+
+    The instructions are sent once per batch instead of once per ticket,
+    and the per-request latency is paid once for the whole batch.
+    Batches of 8-16 tickets keep the output short enough to stay reliable.
+    """
+
+    def __init__(self, batch_size: int = 8):
+        """
+        Args:
+            batch_size: Number of tickets sent in each LM call
+        """
+        super().__init__()
+        self.batch_size = batch_size
+        self.classifier = dspy.Predict(BatchClassifier)
+
+    def forward(self, tickets: List[str]) -> List[dspy.Prediction]:
+        predictions = []
+
+        for start in range(0, len(tickets), self.batch_size):
+            batch = tickets[start:start + self.batch_size]
+            result = self.classifier(tickets=batch)
+
+            # Pad missing labels so every ticket gets a prediction
+            categories = list(result.categories) + [""] * len(batch)
+            priorities = list(result.priorities) + [""] * len(batch)
+
+            for category, priority in zip(categories[:len(batch)], priorities[:len(batch)]):
+                predictions.append(dspy.Prediction(
+                    category=category,
+                    priority=priority
+                ))
+
+        return predictions
+
+
 class RefinedTicketClassifier(dspy.Module):
     """
     Ticket classifier using iterative refinement.
@@ -146,8 +299,15 @@ class RefinedTicketClassifier(dspy.Module):
     3. Returning the best prediction based on the reward score
     4. Stopping early if a prediction meets the threshold
 
+    Refine stops at the first attempt that reaches the threshold, so a
+    ticket classified validly on the first try costs a single LM call.
+
     This is particularly useful for ambiguous or complex tickets where
     multiple attempts can improve classification accuracy.
+
+    Each attempt runs at temperature 1.0 with its own rollout_id, so attempts
+    get distinct cache entries while re-running the same tickets (e.g. the
+    validation set in compare_refine.py) is served from DSPy's disk cache.
     """
 
     def __init__(self, N: int = 3, threshold: float = 1.0):
@@ -157,11 +317,11 @@ class RefinedTicketClassifier(dspy.Module):
             threshold: Quality threshold for early stopping (default: 1.0)
         """
         super().__init__()
-        self.valid_categories = set(cat.lower() for cat in CATEGORIES)
-        self.valid_priorities = set(pri.lower() for pri in PRIORITIES)
+        self.valid_categories = CATEGORIES_LC
+        self.valid_priorities = PRIORITIES_LC
 
         # Create the base classifier module
-        base_module = dspy.ChainOfThought(TicketClassifier)
+        base_module = _chain_of_thought(TicketClassifier)
 
         # Create the refined module with reward function
         self.refine = dspy.Refine(
@@ -182,17 +342,17 @@ class RefinedTicketClassifier(dspy.Module):
         """
         score = 0.0
 
+        # One lookup per field (missing fields count as invalid)
+        category = prediction.get('category') or ''
+        priority = prediction.get('priority') or ''
+
         # Check if category is valid
-        if hasattr(prediction, 'category'):
-            category_valid = prediction.category.strip().lower() in self.valid_categories
-            if category_valid:
-                score += 0.5
+        if category.strip().lower() in self.valid_categories:
+            score += 0.5
 
         # Check if priority is valid
-        if hasattr(prediction, 'priority'):
-            priority_valid = prediction.priority.strip().lower() in self.valid_priorities
-            if priority_valid:
-                score += 0.5
+        if priority.strip().lower() in self.valid_priorities:
+            score += 0.5
 
         return score
 
@@ -209,6 +369,59 @@ class RefinedTicketClassifier(dspy.Module):
         )
 
 
+async def aclassify_batch(
+    classifier: dspy.Module,
+    tickets: List[str],
+    max_concurrency: int = 8
+) -> List[dspy.Prediction]:
+    """
+    Classify several tickets with concurrent requests.
+
+    The requests are sent together so that the server can decode them in
+    parallel (e.g. Ollama with OLLAMA_NUM_PARALLEL), instead of one ticket
+    at a time. The classifier must support async calls (aforward), like
+    SimpleTicketClassifier. Use `await aclassify_batch(...)` where an event
+    loop is already running (e.g. Jupyter), classify_batch elsewhere.
+
+    Args:
+        classifier: The DSPy module used for each ticket
+        tickets: Ticket descriptions to classify
+        max_concurrency: Maximum number of requests in flight
+
+    Returns:
+        List of predictions, in the same order as the tickets
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def classify(ticket):
+        async with semaphore:
+            return await classifier.acall(ticket=ticket)
+
+    return await asyncio.gather(*(classify(ticket) for ticket in tickets))
+
+
+def classify_batch(
+    classifier: dspy.Module,
+    tickets: List[str],
+    max_concurrency: int = 8
+) -> List[dspy.Prediction]:
+    """
+    Synchronous version of aclassify_batch (same arguments and result).
+
+    Raises:
+        RuntimeError: If called while an event loop is running (e.g. in
+                      Jupyter); await aclassify_batch there instead
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(aclassify_batch(classifier, tickets, max_concurrency))
+    raise RuntimeError(
+        "classify_batch cannot run inside an event loop (e.g. Jupyter): "
+        "use 'await aclassify_batch(...)' instead"
+    )
+
+
 if __name__ == "__main__":
     # Example usage
     from config import configure_ollama
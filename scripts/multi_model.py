@@ -4,14 +4,24 @@ Multi-model configuration and hybrid architectures.
 This module provides utilities for:
 - Configuring multiple language models (Ollama, OpenAI, Anthropic)
 - Benchmarking different models
+- Comparing models side by side on a single ticket (sync or async)
 - Creating hybrid architectures that use different models for different tasks
 """
 
 import dspy
 import time
 import os
-from typing import List, Callable, Dict
+import asyncio
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Callable, Dict, Optional
+from config import get_lm, ANTHROPIC_PROMPT_CACHING
 from signatures import CategoryClassifier, PriorityClassifier
+from metrics import mean_score
+
+# Output budget for benchmarks without reasoning: only the two labels
+# (plus adapter field markers) need to be generated.
+BENCHMARK_MAX_TOKENS = 64
 
 
 def configure_ollama_models() -> Dict[str, dspy.LM]:
@@ -24,24 +34,27 @@ def configure_ollama_models() -> Dict[str, dspy.LM]:
     models = {}
 
     # Llama 3.1 (8B)
-    models['llama3.1:8b'] = dspy.LM(
+    models['llama3.1:8b'] = get_lm(
         model='ollama_chat/llama3.1:8b',
         api_base='http://localhost:11434',
-        temperature=0.3
+        temperature=0.3,
+        cache=True
     )
 
     # Mistral (7B)
-    models['mistral:7b'] = dspy.LM(
+    models['mistral:7b'] = get_lm(
         model='ollama_chat/mistral:7b',
         api_base='http://localhost:11434',
-        temperature=0.3
+        temperature=0.3,
+        cache=True
     )
 
     # Qwen 2.5 (7B)
-    models['qwen2.5:7b'] = dspy.LM(
+    models['qwen2.5:7b'] = get_lm(
         model='ollama_chat/qwen2.5:7b',
         api_base='http://localhost:11434',
-        temperature=0.3
+        temperature=0.3,
+        cache=True
     )
 
     print(f"✅ Configured {len(models)} Ollama models:")
@@ -67,15 +80,17 @@ def configure_openai_models() -> Dict[str, dspy.LM]:
     models = {}
 
     # GPT-4o-mini
-    models['gpt-4o-mini'] = dspy.LM(
+    models['gpt-4o-mini'] = get_lm(
         model='openai/gpt-4o-mini',
-        temperature=0.3
+        temperature=0.3,
+        cache=True
     )
 
     # GPT-4o
-    models['gpt-4o'] = dspy.LM(
+    models['gpt-4o'] = get_lm(
         model='openai/gpt-4o',
-        temperature=0.3
+        temperature=0.3,
+        cache=True
     )
 
     print(f"✅ Configured {len(models)} OpenAI models:")
@@ -101,15 +116,19 @@ def configure_anthropic_models() -> Dict[str, dspy.LM]:
     models = {}
 
     # Claude 3.5 Haiku
-    models['claude-3-5-haiku'] = dspy.LM(
+    models['claude-3-5-haiku'] = get_lm(
         model='anthropic/claude-3-5-haiku-20241022',
-        temperature=0.3
+        temperature=0.3,
+        cache=True,
+        cache_control_injection_points=ANTHROPIC_PROMPT_CACHING
     )
 
     # Claude 3.5 Sonnet
-    models['claude-3-5-sonnet'] = dspy.LM(
+    models['claude-3-5-sonnet'] = get_lm(
         model='anthropic/claude-3-5-sonnet-20241022',
-        temperature=0.3
+        temperature=0.3,
+        cache=True,
+        cache_control_injection_points=ANTHROPIC_PROMPT_CACHING
     )
 
     print(f"✅ Configured {len(models)} Anthropic models:")
@@ -119,11 +138,58 @@ def configure_anthropic_models() -> Dict[str, dspy.LM]:
     return models
 
 
+def warmup_ollama_models(models: Dict[str, dspy.LM], keep_alive: str = '10m') -> None:
+    """
+    Load Ollama models into memory before they are used.
+
+    Ollama loads a model on its first request, which can take tens of
+    seconds. An empty prompt loads the model without generating anything;
+    the requests are sent concurrently so load times overlap. Non-Ollama
+    models are ignored.
+
+    Args:
+        models: Dictionary of {model_name: language_model}
+        keep_alive: How long Ollama keeps each model resident afterwards
+    """
+    def warmup(lm):
+        api_base = lm.kwargs.get('api_base', 'http://localhost:11434')
+        try:
+            requests.post(
+                f"{api_base}/api/generate",
+                json={'model': lm.model.split('/', 1)[1], 'prompt': '', 'keep_alive': keep_alive},
+                timeout=300
+            )
+        except requests.RequestException as e:
+            print(f"⚠️ Could not warm up {lm.model}: {e}")
+
+    ollama_lms = [lm for lm in models.values() if lm.model.startswith('ollama')]
+    if not ollama_lms:
+        return
+
+    print(f"🔥 Loading {len(ollama_lms)} Ollama models...")
+    with ThreadPoolExecutor(max_workers=len(ollama_lms)) as executor:
+        list(executor.map(warmup, ollama_lms))
+
+
+def _benchmark_classifier(use_cot: bool = False) -> dspy.Module:
+    """Build the classifier used by the benchmarks (LM-agnostic, reusable across models)."""
+    from modules import SimpleTicketClassifier
+
+    if use_cot:
+        return SimpleTicketClassifier()
+    return SimpleTicketClassifier(use_cot=False, max_tokens=BENCHMARK_MAX_TOKENS)
+
+
 def benchmark_model(
     lm: dspy.LM,
     model_name: str,
     examples: List,
-    metric: Callable
+    metric: Callable,
+    num_threads: int = 8,
+    batch_size: Optional[int] = None,
+    use_cot: bool = False,
+    stop_below: Optional[float] = None,
+    classifier: Optional[dspy.Module] = None
 ) -> Dict:
     """
     Benchmark a model on a set of examples.
@@ -133,85 +199,290 @@ def benchmark_model(
         model_name: Name of the model (for display)
         examples: Test examples
         metric: Evaluation metric
+        num_threads: Number of examples evaluated in parallel. Match it to the
+                     provider's capacity (e.g. OLLAMA_NUM_PARALLEL for Ollama,
+                     higher for hosted APIs).
+        batch_size: If set, classify this many tickets per LM call with
+                    BatchTicketClassifier instead of one call per ticket
+        use_cot: Benchmark with ChainOfThought. By default the classifier uses
+                 Predict with a small max_tokens, since the reasoning is not
+                 used and dominates generation time.
+        stop_below: If set, the benchmark stops as soon as the final score
+                    can no longer reach this value. The score is then computed
+                    on the examples evaluated so far. Not supported with
+                    batch_size.
+        classifier: Classifier to benchmark. The LM is bound at call time, so
+                    a single instance can be shared by all benchmarked models
+                    (default: a new one built according to use_cot)
 
     Returns:
-        Dictionary with score and execution time
+        Dictionary with score, execution time, number of evaluated examples
+        and whether the benchmark was stopped early
     """
-    from modules import SimpleTicketClassifier
-
-    # Configure DSPy with this model
-    dspy.configure(lm=lm)
+    from evaluation import evaluate_module, evaluate_until
 
-    # Create classifier
-    classifier = SimpleTicketClassifier()
+    if batch_size and stop_below is not None:
+        raise ValueError("stop_below is not supported with batch_size")
 
-    # Measure time
-    start_time = time.time()
+    if batch_size:
+        return _benchmark_batched(lm, model_name, examples, metric, batch_size)
 
-    # Evaluate
-    total_score = 0
-    for example in examples:
-        ticket = example['ticket'] if isinstance(example, dict) else example.ticket
-        prediction = classifier(ticket=ticket)
-        score = metric(example, prediction)
-        total_score += score
+    # Create classifier
+    if classifier is None:
+        classifier = _benchmark_classifier(use_cot)
+
+    # Use this model for the current thread only (global settings untouched)
+    with dspy.context(lm=lm):
+        # Measure time
+        start_time = time.perf_counter()
+
+        # Evaluate
+        if stop_below is None:
+            avg_score = evaluate_module(classifier, examples, metric, num_threads=num_threads)
+            n_evaluated = len(examples)
+        else:
+            avg_score, n_evaluated = evaluate_until(
+                classifier, examples, metric, stop_below, num_threads=num_threads
+            )
 
-    end_time = time.time()
+        end_time = time.perf_counter()
 
     # Calculate results
-    avg_score = total_score / len(examples)
     elapsed_time = end_time - start_time
 
     return {
         'model': model_name,
         'score': avg_score,
-        'time': elapsed_time
+        'time': elapsed_time,
+        'num_evaluated': n_evaluated,
+        'stopped': n_evaluated < len(examples)
+    }
+
+
+def _benchmark_batched(
+    lm: dspy.LM,
+    model_name: str,
+    examples: List,
+    metric: Callable,
+    batch_size: int
+) -> Dict:
+    """Benchmark a model with several tickets packed into each LM call."""
+    from modules import BatchTicketClassifier
+
+    classifier = BatchTicketClassifier(batch_size=batch_size)
+    # dspy.Example supports item access too, so no type check is needed
+    tickets = [example['ticket'] for example in examples]
+
+    with dspy.context(lm=lm):
+        start_time = time.perf_counter()
+        predictions = classifier(tickets=tickets)
+        end_time = time.perf_counter()
+
+    return {
+        'model': model_name,
+        'score': mean_score(examples, predictions, metric),
+        'time': end_time - start_time,
+        'num_evaluated': len(examples),
+        'stopped': False
     }
 
 
 def benchmark_multiple_models(
     models: Dict[str, dspy.LM],
     examples: List,
-    metric: Callable
+    metric: Callable,
+    num_threads: int = 8,
+    max_workers: int = 1,
+    batch_size: Optional[int] = None,
+    use_cot: bool = False,
+    early_stop_margin: Optional[float] = None,
+    warmup: bool = True
 ) -> List[Dict]:
     """
     Benchmark multiple models and compare results.
 
+    Models are benchmarked one at a time by default, so that their timings
+    are comparable. With max_workers > 1, several models run concurrently,
+    each in its own thread with its own dspy.context: faster overall, but
+    models served by the same Ollama instance then compete for the same
+    hardware and their times are inflated.
+
     Args:
         models: Dictionary of {model_name: language_model}
         examples: Test examples
         metric: Evaluation metric
+        num_threads: Number of examples evaluated in parallel per model
+        max_workers: Number of models benchmarked at once (default: 1, sequential)
+        batch_size: If set, classify this many tickets per LM call
+        use_cot: Benchmark with ChainOfThought instead of Predict
+        early_stop_margin: If set, models are benchmarked one at a time (list
+                           the strongest first) and a model is stopped as soon
+                           as it cannot come within this margin of the best
+                           score so far. Not supported with batch_size.
+        warmup: Load Ollama models before benchmarking, so that model load
+                time is not counted in the measured times
 
     Returns:
-        List of result dictionaries, sorted by score (descending)
+        List of result dictionaries: complete runs sorted by score
+        (descending), then the runs stopped early
     """
+    if batch_size and early_stop_margin is not None:
+        raise ValueError("early_stop_margin is not supported with batch_size")
+
     results = []
 
+    if warmup:
+        warmup_ollama_models(models)
+
     print(f"🔍 Benchmarking {len(models)} models...")
     print(f"⏰ This will take a few minutes\n")
 
-    for i, (name, lm) in enumerate(models.items(), 1):
-        print(f"{i}/{len(models)} Evaluating {name}...")
+    # One classifier for all models: only the LM bound via dspy.context changes
+    classifier = None if batch_size else _benchmark_classifier(use_cot)
+
+    if early_stop_margin is not None:
+        best_score = None
+        for i, (name, lm) in enumerate(models.items(), 1):
+            print(f"{i}/{len(models)} Evaluating {name}...")
 
-        result = benchmark_model(lm, name, examples, metric)
-        results.append(result)
+            stop_below = None if best_score is None else best_score - early_stop_margin
+            result = benchmark_model(
+                lm, name, examples, metric, num_threads, batch_size, use_cot,
+                stop_below=stop_below, classifier=classifier
+            )
+            results.append(result)
+            # A stopped run's partial score is not comparable to full runs
+            if not result['stopped']:
+                best_score = max(result['score'], best_score or 0.0)
+
+            print(f"   Score: {result['score']:.2%} | Time: {result['time']:.1f}s"
+                  + (f" | stopped after {result['num_evaluated']} examples" if result['stopped'] else "") + "\n")
+        return _print_benchmark_summary(results)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                benchmark_model, lm, name, examples, metric, num_threads, batch_size, use_cot,
+                classifier=classifier
+            )
+            for name, lm in models.items()
+        ]
 
-        print(f"   Score: {result['score']:.2%} | Time: {result['time']:.1f}s\n")
+        for i, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
 
-    # Sort by score (descending)
-    results.sort(key=lambda x: x['score'], reverse=True)
+            print(f"{i}/{len(models)} {result['model']} done")
+            print(f"   Score: {result['score']:.2%} | Time: {result['time']:.1f}s\n")
+
+    return _print_benchmark_summary(results)
+
+
+def _print_benchmark_summary(results: List[Dict]) -> List[Dict]:
+    """
+    Sort benchmark results by score (descending) and print them.
+
+    Runs stopped early only have a partial score, computed on fewer
+    examples, so they are listed after the complete runs and marked.
+    """
+    # Complete runs first, each group sorted by score (descending)
+    results.sort(key=lambda x: (not x['stopped'], x['score']), reverse=True)
 
     # Print summary
     print("=" * 60)
     print("📊 BENCHMARK RESULTS")
     print("=" * 60)
     for r in results:
-        print(f"{r['model']:20} | Score: {r['score']:6.2%} | Time: {r['time']:5.1f}s")
+        line = f"{r['model']:20} | Score: {r['score']:6.2%} | Time: {r['time']:5.1f}s"
+        if r['stopped']:
+            line += f" | stopped ({r['num_evaluated']} examples)"
+        print(line)
     print("=" * 60)
 
     return results
 
 
+def _event_loop_running() -> bool:
+    """Whether this thread is running an event loop (where asyncio.run fails)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+async def _classify_with_models(
+    models: Dict[str, dspy.LM],
+    ticket: str
+) -> List:
+    """Classify one ticket with every model concurrently (exceptions are returned, not raised)."""
+    from modules import SimpleTicketClassifier
+
+    classifier = SimpleTicketClassifier()
+
+    async def classify(lm):
+        # Each task gets its own context, so the LM override stays local to it
+        with dspy.context(lm=lm):
+            return await classifier.acall(ticket=ticket)
+
+    return await asyncio.gather(
+        *(classify(lm) for lm in models.values()),
+        return_exceptions=True
+    )
+
+
+async def acompare_models_on_ticket(
+    models: Dict[str, dspy.LM],
+    ticket: str
+) -> Dict[str, dspy.Prediction]:
+    """
+    Classify a single ticket with several models and print their answers.
+
+    The models are independent endpoints, so they are queried concurrently:
+    total wall time is that of the slowest model, not the sum. Use
+    `await acompare_models_on_ticket(...)` where an event loop is already
+    running (e.g. Jupyter), compare_models_on_ticket elsewhere.
+
+    Args:
+        models: Dictionary of {model_name: language_model}
+        ticket: Ticket description to classify
+
+    Returns:
+        Dictionary of {model_name: prediction} for the models that answered
+    """
+    results = await _classify_with_models(models, ticket)
+
+    print(f"🎫 Ticket: {ticket}")
+    predictions = {}
+    for name, result in zip(models, results):
+        if isinstance(result, Exception):
+            print(f"   {name:20} | ⚠️ {result}")
+        else:
+            print(f"   {name:20} | {result.category} / {result.priority}")
+            predictions[name] = result
+
+    return predictions
+
+
+def compare_models_on_ticket(
+    models: Dict[str, dspy.LM],
+    ticket: str
+) -> Dict[str, dspy.Prediction]:
+    """
+    Synchronous version of acompare_models_on_ticket (same arguments and result).
+
+    Raises:
+        RuntimeError: If called while an event loop is running (e.g. in
+                      Jupyter); await acompare_models_on_ticket there instead
+    """
+    if _event_loop_running():
+        raise RuntimeError(
+            "compare_models_on_ticket cannot run inside an event loop (e.g. Jupyter): "
+            "use 'await acompare_models_on_ticket(...)' instead"
+        )
+    return asyncio.run(acompare_models_on_ticket(models, ticket))
+
+
 class HybridTicketClassifier(dspy.Module):
     """
     Hybrid classifier using different models for different tasks.
@@ -228,19 +499,19 @@ class HybridTicketClassifier(dspy.Module):
         super().__init__()
         self.fast_lm = fast_lm
         self.accurate_lm = accurate_lm
-        self.category_signature = CategoryClassifier
-        self.priority_signature = PriorityClassifier
+
+        # Built once; only the LM changes at call time
+        self.category_predictor = dspy.ChainOfThought(CategoryClassifier)
+        self.priority_predictor = dspy.ChainOfThought(PriorityClassifier)
 
     def forward(self, ticket):
         # Step 1: Categorization with fast model
         with dspy.settings.context(lm=self.fast_lm):
-            category_predictor = dspy.ChainOfThought(self.category_signature)
-            category_result = category_predictor(ticket=ticket)
+            category_result = self.category_predictor(ticket=ticket)
 
         # Step 2: Prioritization with accurate model
         with dspy.settings.context(lm=self.accurate_lm):
-            priority_predictor = dspy.ChainOfThought(self.priority_signature)
-            priority_result = priority_predictor(
+            priority_result = self.priority_predictor(
                 ticket=ticket,
                 category=category_result.category
             )
@@ -263,6 +534,9 @@ if __name__ == "__main__":
 
     # Benchmark on a few examples
     if ollama_models:
+        print("\n🔀 Same ticket, all models")
+        compare_models_on_ticket(ollama_models, valset[0]['ticket'])
+
         print("\n" + "=" * 60)
         print("Running benchmarks on 3 validation examples")
         print("=" * 60 + "\n")
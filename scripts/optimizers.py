@@ -9,7 +9,88 @@ This module provides utilities to optimize DSPy modules using various optimizers
 
 from dspy.teleprompt import BootstrapFewShot, MIPROv2
 import dspy
-from typing import Callable, List
+import hashlib
+import json
+import textwrap
+from itertools import islice
+from pathlib import Path
+from typing import Callable, List, Optional
+
+# Directory for compiled programs, for callers that opt in with
+# cache_dir=COMPILED_PROGRAMS_DIR. Kept apart from DSPy's LM response cache
+COMPILED_PROGRAMS_DIR = ".compiled_programs"
+
+# Compiled programs are not cached unless a cache_dir is given
+COMPILE_CACHE_DIR = None
+
+# Smallest trainset for which a MIPROv2 run is worth its cost, per auto mode.
+# Below this, instruction search rarely beats plain few-shot bootstrapping.
+MIPRO_MIN_TRAINSET = {"light": 15, "medium": 30, "heavy": 50}
+
+
+def _compile_cache_path(
+    cache_dir: Optional[str],
+    optimizer_name: str,
+    module: dspy.Module,
+    trainset: List[dspy.Example],
+    metric: Callable,
+    **params
+) -> Optional[Path]:
+    """
+    Return the file where a compiled program is cached (None if caching is off).
+
+    The key hashes everything that determines the optimizer's output: the
+    optimizer, the module class and its signatures, the training data, the
+    metric, the LM with its kwargs and the hyperparameters. Metrics without
+    a stable name (lambdas, partials, local functions) are not cached, since
+    two different ones would share the same key.
+    """
+    if cache_dir is None:
+        return None
+
+    metric_key = _metric_key(metric)
+    if metric_key is None:
+        print(f"⚠️ Not caching the compiled program: metric {metric!r} has no stable name")
+        return None
+
+    lm = dspy.settings.lm
+    key = json.dumps({
+        "optimizer": optimizer_name,
+        "cls": type(module).__name__,
+        "signatures": [(name, repr(p.signature)) for name, p in module.named_predictors()],
+        "train": [example.toDict() for example in trainset],
+        "metric": metric_key,
+        "lm": [getattr(lm, "model", None), getattr(lm, "kwargs", None)],
+        "params": params,
+    }, sort_keys=True, default=str)
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+    return Path(cache_dir) / f"{optimizer_name}_{digest}.json"
+
+
+def _metric_key(metric: Callable) -> Optional[str]:
+    """Module and qualified name of a metric (None for lambdas, partials and local functions)."""
+    qualname = getattr(metric, "__qualname__", None)
+    if qualname is None or "<lambda>" in qualname or "<locals>" in qualname:
+        return None
+    return f"{metric.__module__}.{qualname}"
+
+
+def _load_compiled(module: dspy.Module, path: Optional[Path]) -> Optional[dspy.Module]:
+    """Load a cached compiled program into a copy of module, if the file exists."""
+    if path is None or not path.exists():
+        return None
+    compiled = module.deepcopy()
+    compiled.load(str(path))
+    print(f"💾 Loaded compiled program from {path}")
+    return compiled
+
+
+def _save_compiled(compiled: dspy.Module, path: Optional[Path]):
+    """Save a compiled program to the cache (no-op if caching is off)."""
+    if path is None:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    compiled.save(str(path))
 
 
 def optimize_with_bootstrap(
@@ -17,7 +98,8 @@ def optimize_with_bootstrap(
     trainset: List[dspy.Example],
     metric: Callable,
     max_bootstrapped_demos: int = 4,
-    max_labeled_demos: int = 4
+    max_labeled_demos: int = 4,
+    cache_dir: Optional[str] = COMPILE_CACHE_DIR
 ) -> dspy.Module:
     """
     Optimize a module using BootstrapFewShot.
@@ -31,10 +113,22 @@ def optimize_with_bootstrap(
         metric: Metric function for evaluation
         max_bootstrapped_demos: Number of examples to generate
         max_labeled_demos: Maximum examples to use in prompts
+        cache_dir: Directory where compiled programs are saved and reused
+                   on later runs with the same inputs, e.g.
+                   COMPILED_PROGRAMS_DIR (default: None, no caching)
 
     Returns:
         Optimized module with demonstration examples
     """
+    cache_path = _compile_cache_path(
+        cache_dir, "bootstrap", module, trainset, metric,
+        max_bootstrapped_demos=max_bootstrapped_demos,
+        max_labeled_demos=max_labeled_demos
+    )
+    cached = _load_compiled(module, cache_path)
+    if cached is not None:
+        return cached
+
     print("🔧 Optimizing with BootstrapFewShot...")
 
     optimizer = BootstrapFewShot(
@@ -48,6 +142,7 @@ def optimize_with_bootstrap(
         trainset=trainset
     )
 
+    _save_compiled(optimized, cache_path)
     print("✅ BootstrapFewShot optimization complete")
     return optimized
 
@@ -58,7 +153,9 @@ def optimize_with_mipro(
     metric: Callable,
     auto: str = "light",
     max_bootstrapped_demos: int = 3,
-    max_labeled_demos: int = 3
+    max_labeled_demos: int = 3,
+    cache_dir: Optional[str] = COMPILE_CACHE_DIR,
+    num_threads: int = 8
 ) -> dspy.Module:
     """
     Optimize a module using MIPROv2.
@@ -73,17 +170,54 @@ def optimize_with_mipro(
         auto: Optimization intensity: "light", "medium", or "heavy"
         max_bootstrapped_demos: Number of demo examples to generate
         max_labeled_demos: Maximum demos to use
+        cache_dir: Directory where compiled programs are saved and reused
+                   on later runs with the same inputs, e.g.
+                   COMPILED_PROGRAMS_DIR (default: None, no caching)
+        num_threads: Number of candidate evaluations run in parallel
+
+    Falls back to optimize_with_bootstrap when the trainset is smaller than
+    MIPRO_MIN_TRAINSET[auto], which saves a long run that would likely not
+    improve on it, and when MIPROv2 fails. The optimizer that actually ran is
+    recorded in the `optimizer_used` attribute of the returned module
+    ("MIPROv2", "BootstrapFewShot", or None for the original module).
 
     Returns:
         Optimized module with improved instructions and examples
     """
+    min_trainset = MIPRO_MIN_TRAINSET.get(auto, 0)
+    if len(trainset) < min_trainset:
+        print(f"⚠️ MIPROv2 ({auto}) needs at least {min_trainset} training examples, got {len(trainset)}")
+        print("   Using BootstrapFewShot instead")
+        optimized = optimize_with_bootstrap(
+            module,
+            trainset,
+            metric,
+            max_bootstrapped_demos=max_bootstrapped_demos,
+            max_labeled_demos=max_labeled_demos,
+            cache_dir=cache_dir
+        )
+        optimized.optimizer_used = "BootstrapFewShot"
+        return optimized
+
+    cache_path = _compile_cache_path(
+        cache_dir, "mipro", module, trainset, metric,
+        auto=auto,
+        max_bootstrapped_demos=max_bootstrapped_demos,
+        max_labeled_demos=max_labeled_demos
+    )
+    cached = _load_compiled(module, cache_path)
+    if cached is not None:
+        cached.optimizer_used = "MIPROv2"
+        return cached
+
     print("🚀 Optimizing with MIPROv2...")
     print(f"⏱️ Mode: {auto} (This may take 10-20 minutes with Ollama)\n")
 
     # MIPROv2 avec le paramètre auto (simplifié)
     optimizer = MIPROv2(
         metric=metric,
-        auto=auto  # "light", "medium", or "heavy"
+        auto=auto,  # "light", "medium", or "heavy"
+        num_threads=num_threads
     )
 
     try:
@@ -95,12 +229,32 @@ def optimize_with_mipro(
             requires_permission_to_run=False
         )
 
+        _save_compiled(optimized, cache_path)
         print("\n✅ MIPRO optimization complete")
+        optimized.optimizer_used = "MIPROv2"
         return optimized
 
     except Exception as e:
+        # MIPROv2 keeps its candidates in memory only, so fall back to the
+        # much shorter BootstrapFewShot run rather than to the bare module
         print(f"⚠️ MIPRO optimization error: {e}")
+        print("   Falling back to BootstrapFewShot")
+
+    try:
+        optimized = optimize_with_bootstrap(
+            module,
+            trainset,
+            metric,
+            max_bootstrapped_demos=max_bootstrapped_demos,
+            max_labeled_demos=max_labeled_demos,
+            cache_dir=cache_dir
+        )
+        optimized.optimizer_used = "BootstrapFewShot"
+        return optimized
+    except Exception as e:
+        print(f"⚠️ BootstrapFewShot optimization error: {e}")
         print("   Returning original module")
+        module.optimizer_used = None
         return module
 
 
@@ -118,16 +272,23 @@ def inspect_optimized_demos(optimized_module: dspy.Module, max_demos: int = 3):
     for name, predictor in optimized_module.named_predictors():
         if hasattr(predictor, 'demos') and predictor.demos:
             demos_found = True
-            print(f"📚 Found {len(predictor.demos)} demonstration examples in '{name}':\n")
-
-            for i, demo in enumerate(predictor.demos[:max_demos], 1):
-                print(f"Example {i}:")
-                print(f"  Ticket: {demo.ticket[:80]}...")
-                if hasattr(demo, 'category'):
-                    print(f"  Category: {demo.category}")
-                if hasattr(demo, 'priority'):
-                    print(f"  Priority: {demo.priority}")
-                print()
+            n_demos = len(predictor.demos)
+            print(f"📚 Found {n_demos} demonstration examples in '{name}':\n")
+
+            for i, demo in enumerate(islice(predictor.demos, max_demos), 1):
+                # One print per demo, so output from other threads cannot
+                # land in the middle of it
+                lines = [
+                    f"Example {i}:",
+                    f"  Ticket: {textwrap.shorten(demo.ticket, width=80, placeholder='...')}"
+                ]
+                # Key lookups, rather than hasattr() going through
+                # Example.__getattr__ and a caught AttributeError
+                if 'category' in demo:
+                    lines.append(f"  Category: {demo['category']}")
+                if 'priority' in demo:
+                    lines.append(f"  Priority: {demo['priority']}")
+                print("\n".join(lines) + "\n")
 
             # Only show first predictor with demos
             break
@@ -138,19 +299,33 @@ def inspect_optimized_demos(optimized_module: dspy.Module, max_demos: int = 3):
 
 if __name__ == "__main__":
     # Example usage - Compare both optimizers
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Compare BootstrapFewShot and MIPROv2")
+    parser.add_argument(
+        "--mipro", action="store_true",
+        help="Also run MIPROv2 optimization (10-20 minutes with Ollama). "
+             "Can also be enabled with RUN_MIPRO=1"
+    )
+    args = parser.parse_args()
+    run_mipro = args.mipro or os.environ.get("RUN_MIPRO") == "1"
+
     from config import configure_ollama
     from modules import SimpleTicketClassifier
     from data import get_train_examples, get_val_examples
-    from metrics import exact_match_metric
+    from metrics import exact_match_metric, relative_improvement
     from evaluation import evaluate_module
+    from multi_model import warmup_ollama_models
 
     print("=" * 80)
     print("COMPARISON OF DSPY OPTIMIZERS")
     print("=" * 80)
     print("\nThis script compares BootstrapFewShot and MIPROv2 optimizers.\n")
 
-    # Configure DSPy
-    configure_ollama()
+    # Configure DSPy, and load the model now rather than on the first call
+    lm = configure_ollama()
+    warmup_ollama_models({lm.model: lm}, keep_alive='30m')
 
     # Get data
     train_examples = get_train_examples()
@@ -176,9 +351,9 @@ if __name__ == "__main__":
     print("=" * 80)
     print("⏱️ Expected time: ~10-30 seconds\n")
 
-    baseline_bootstrap = SimpleTicketClassifier()  # Fresh instance
+    # The optimizers compile a copy of the student, so the baseline is reused
     optimized_bootstrap = optimize_with_bootstrap(
-        baseline_bootstrap,
+        baseline,
         train_examples,
         exact_match_metric,
         max_bootstrapped_demos=4,
@@ -186,7 +361,7 @@ if __name__ == "__main__":
     )
 
     score_bootstrap = evaluate_module(optimized_bootstrap, val_examples, exact_match_metric)
-    improvement_bootstrap = ((score_bootstrap - score_baseline) / score_baseline * 100) if score_baseline > 0 else 0
+    improvement_bootstrap = relative_improvement(score_baseline, score_bootstrap)
     print(f"\n📊 BootstrapFewShot score: {score_bootstrap:.2%}")
     print(f"   Improvement: {improvement_bootstrap:+.1f}%\n")
 
@@ -202,12 +377,9 @@ if __name__ == "__main__":
     print("⏱️ Expected time: 10-20 minutes with Ollama")
     print("⚠️ This is a long process - MIPRO tests multiple instruction variants\n")
 
-    response = input("Do you want to run MIPRO optimization? (y/n): ").strip().lower()
-
-    if response == 'y':
-        baseline_mipro = SimpleTicketClassifier()  # Fresh instance
+    if run_mipro:
         optimized_mipro = optimize_with_mipro(
-            baseline_mipro,
+            baseline,
             train_examples,
             exact_match_metric,
             auto="light",  # "light", "medium", or "heavy"
@@ -215,12 +387,19 @@ if __name__ == "__main__":
             max_labeled_demos=3
         )
 
+        # Label the results with the optimizer that actually ran
+        # (optimize_with_mipro falls back to BootstrapFewShot when needed)
+        mipro_label = {
+            "MIPROv2": "MIPROv2",
+            "BootstrapFewShot": "Bootstrap (fallback)",
+        }.get(optimized_mipro.optimizer_used, "Baseline (fallback)")
+
         score_mipro = evaluate_module(optimized_mipro, val_examples, exact_match_metric)
-        improvement_mipro = ((score_mipro - score_baseline) / score_baseline * 100) if score_baseline > 0 else 0
-        print(f"\n📊 MIPROv2 score: {score_mipro:.2%}")
+        improvement_mipro = relative_improvement(score_baseline, score_mipro)
+        print(f"\n📊 {mipro_label} score: {score_mipro:.2%}")
         print(f"   Improvement: {improvement_mipro:+.1f}%\n")
 
-        print("--- Demonstration Examples (MIPROv2) ---")
+        print(f"--- Demonstration Examples ({mipro_label}) ---")
         inspect_optimized_demos(optimized_mipro, max_demos=3)
 
         # =========================================================================
@@ -233,12 +412,12 @@ if __name__ == "__main__":
         print("-" * 45)
         print(f"{'Baseline':<20} {score_baseline:<10.2%} {'-':<15}")
         print(f"{'BootstrapFewShot':<20} {score_bootstrap:<10.2%} {improvement_bootstrap:+.1f}%")
-        print(f"{'MIPROv2':<20} {score_mipro:<10.2%} {improvement_mipro:+.1f}%")
+        print(f"{mipro_label:<20} {score_mipro:<10.2%} {improvement_mipro:+.1f}%")
         print("=" * 80)
 
         # Determine winner
         if score_mipro > score_bootstrap and score_mipro > score_baseline:
-            print("\n🏆 Winner: MIPROv2")
+            print(f"\n🏆 Winner: {mipro_label}")
         elif score_bootstrap > score_mipro and score_bootstrap > score_baseline:
             print("\n🏆 Winner: BootstrapFewShot")
         elif score_baseline >= max(score_bootstrap, score_mipro):
@@ -247,7 +426,7 @@ if __name__ == "__main__":
             print("\n🤝 Tie between optimizers")
 
     else:
-        print("\n⏭️ Skipping MIPRO optimization")
+        print("\n⏭️ Skipping MIPRO optimization (use --mipro to run it)")
         print("\n" + "=" * 80)
         print("RESULTS (without MIPRO)")
         print("=" * 80)
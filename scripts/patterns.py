@@ -6,14 +6,103 @@ This module implements several patterns to make DSPy modules more robust:
 - Retry: Automatically retry on errors
 - Fallback: Use backup model if primary fails
 - Ensemble: Combine multiple predictions
+- Cache: Reuse predictions for tickets already classified
 """
 
+import asyncio
+import contextvars
 import dspy
+import logging
+import random
+import re
+import threading
 import time
-from typing import List, Tuple
-from collections import Counter
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from collections import Counter, OrderedDict
 from signatures import TicketClassifier
-from data import CATEGORIES, PRIORITIES
+from data import CATEGORY_BY_LC, PRIORITY_BY_LC, closest_label
+
+# Error-path messages go through logging: unlike print, a filtered-out level
+# costs a single check and does not take the stdout lock in parallel calls
+logger = logging.getLogger(__name__)
+
+# Fuzzy matching of invalid labels: keyword fragment -> canonical label.
+# Each table is compiled into a single regex, so an invalid label is scanned
+# once instead of once per keyword. The tables are in rule priority order:
+# when several keywords match, the earliest one wins (see _match_keyword).
+_CATEGORY_KEYWORDS = {
+    'hard': 'Hardware', 'matér': 'Hardware',
+    'soft': 'Software', 'logic': 'Software',
+    'réseau': 'Network', 'network': 'Network',
+    'compte': 'Account', 'account': 'Account',
+}
+_PRIORITY_KEYWORDS = {
+    'critic': 'Critical', 'critique': 'Critical',
+    'urgent': 'Urgent',
+    'high': 'High', 'haut': 'High',
+    'medium': 'Medium', 'moyen': 'Medium',
+}
+# Zero-width lookahead, so that overlapping keywords are all found
+_CATEGORY_RE = re.compile('(?=(%s))' % '|'.join(map(re.escape, _CATEGORY_KEYWORDS)))
+_PRIORITY_RE = re.compile('(?=(%s))' % '|'.join(map(re.escape, _PRIORITY_KEYWORDS)))
+_KEYWORD_RANK = {
+    keyword: rank
+    for keywords in (_CATEGORY_KEYWORDS, _PRIORITY_KEYWORDS)
+    for rank, keyword in enumerate(keywords)
+}
+
+
+def _match_keyword(pattern: re.Pattern, keywords: Dict[str, str], label: str) -> Optional[str]:
+    """
+    Return the canonical label of the highest-priority keyword found in label.
+
+    The rule order matters, not the position in the label: 'high, not
+    critical' is Critical and 'software / hardware' is Hardware.
+    """
+    found = [match.group(1) for match in pattern.finditer(label)]
+    if not found:
+        return None
+    return keywords[min(found, key=_KEYWORD_RANK.get)]
+
+
+@lru_cache(maxsize=512)
+def _validate_and_correct(category_lower: str, priority_lower: str) -> Tuple[str, str, bool]:
+    """
+    Validate and correct normalized labels (see ValidatedTicketClassifier).
+
+    Memoized: a pure function of the two labels, and LM outputs repeat the
+    same few labels over and over.
+    """
+    is_valid = True
+
+    # Validate category (known labels only need their casing normalized)
+    category = CATEGORY_BY_LC.get(category_lower)
+    if category is None:
+        # Try fuzzy matching
+        category = _match_keyword(_CATEGORY_RE, _CATEGORY_KEYWORDS, category_lower)
+        if category is None:
+            # Typo of a valid label (e.g. 'Hardaware'), otherwise default
+            category = closest_label(category_lower, CATEGORY_BY_LC)
+            if category is None:
+                category = 'Application'  # Default
+                is_valid = False
+
+    # Validate priority
+    priority = PRIORITY_BY_LC.get(priority_lower)
+    if priority is None:
+        # Try fuzzy matching
+        priority = _match_keyword(_PRIORITY_RE, _PRIORITY_KEYWORDS, priority_lower)
+        if priority is None:
+            # Typo of a valid label (e.g. 'Urgnet'), otherwise default
+            priority = closest_label(priority_lower, PRIORITY_BY_LC)
+            if priority is None:
+                priority = 'Low'  # Default
+                is_valid = False
+
+    return category, priority, is_valid
 
 
 class ValidatedTicketClassifier(dspy.Module):
@@ -27,8 +116,6 @@ class ValidatedTicketClassifier(dspy.Module):
     def __init__(self):
         super().__init__()
         self.classifier = dspy.ChainOfThought(TicketClassifier)
-        self.valid_categories = set(cat.lower() for cat in CATEGORIES)
-        self.valid_priorities = set(pri.lower() for pri in PRIORITIES)
 
     def validate_and_correct(self, category: str, priority: str) -> Tuple[str, str, bool]:
         """
@@ -37,48 +124,7 @@ class ValidatedTicketClassifier(dspy.Module):
         Returns:
             (category, priority, is_valid): Corrected values and validation status
         """
-        category_lower = category.strip().lower()
-        priority_lower = priority.strip().lower()
-
-        is_valid = True
-
-        # Validate category
-        if category_lower not in self.valid_categories:
-            # Try fuzzy matching
-            if 'hard' in category_lower or 'matér' in category_lower:
-                category = 'Hardware'
-            elif 'soft' in category_lower or 'logic' in category_lower:
-                category = 'Software'
-            elif 'réseau' in category_lower or 'network' in category_lower:
-                category = 'Network'
-            elif 'compte' in category_lower or 'account' in category_lower:
-                category = 'Account'
-            else:
-                category = 'Application'  # Default
-                is_valid = False
-        else:
-            # Normalize casing
-            category = next(c for c in CATEGORIES if c.lower() == category_lower)
-
-        # Validate priority
-        if priority_lower not in self.valid_priorities:
-            # Try fuzzy matching
-            if 'critic' in priority_lower or 'critique' in priority_lower:
-                priority = 'Critical'
-            elif 'urgent' in priority_lower:
-                priority = 'Urgent'
-            elif 'high' in priority_lower or 'haut' in priority_lower:
-                priority = 'High'
-            elif 'medium' in priority_lower or 'moyen' in priority_lower:
-                priority = 'Medium'
-            else:
-                priority = 'Low'  # Default
-                is_valid = False
-        else:
-            # Normalize casing
-            priority = next(p for p in PRIORITIES if p.lower() == priority_lower)
-
-        return category, priority, is_valid
+        return _validate_and_correct(category.strip().lower(), priority.strip().lower())
 
     def forward(self, ticket):
         # Get prediction
@@ -101,19 +147,31 @@ class RetryTicketClassifier(dspy.Module):
     """
     Classifier with retry logic for handling errors.
 
-    Automatically retries on failure with exponential backoff.
+    Automatically retries on failure with capped exponential backoff. A random
+    jitter is added to each delay so that concurrent callers failing at the
+    same time do not all retry at the same time.
     """
 
-    def __init__(self, max_retries: int = 3, initial_delay: float = 1.0):
+    def __init__(
+        self,
+        max_retries: int = 3,
+        initial_delay: float = 1.0,
+        max_delay: float = 30.0,
+        jitter: float = 0.1
+    ):
         """
         Args:
             max_retries: Maximum number of retry attempts
             initial_delay: Initial delay in seconds (doubles on each retry)
+            max_delay: Upper bound of the backoff delay in seconds
+            jitter: Maximum random extra delay, as a fraction of the backoff delay
         """
         super().__init__()
         self.classifier = dspy.ChainOfThought(TicketClassifier)
         self.max_retries = max_retries
         self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
 
     def forward(self, ticket):
         last_error = None
@@ -137,11 +195,11 @@ class RetryTicketClassifier(dspy.Module):
                 if attempt == self.max_retries - 1:
                     break
 
-                # Calculate delay with exponential backoff
-                delay = self.initial_delay * (2 ** attempt)
+                # Calculate delay with capped exponential backoff plus jitter
+                delay = min(self.initial_delay * (1 << attempt), self.max_delay)
+                delay += random.uniform(0, self.jitter * delay)
 
-                print(f"⚠️ Attempt {attempt + 1} failed: {e}")
-                print(f"   Retrying in {delay:.1f}s...")
+                logger.warning("Attempt %d failed: %s. Retrying in %.1fs...", attempt + 1, e, delay)
 
                 time.sleep(delay)
 
@@ -154,51 +212,82 @@ class FallbackTicketClassifier(dspy.Module):
     Classifier with fallback to a backup model.
 
     If the primary model fails, automatically switches to a fallback model.
+    After several consecutive primary failures, the primary model is skipped
+    for a cooldown period (circuit breaker), so an outage does not add its
+    timeout to every call.
     """
 
-    def __init__(self, primary_lm: dspy.LM, fallback_lm: dspy.LM):
+    def __init__(
+        self,
+        primary_lm: dspy.LM,
+        fallback_lm: dspy.LM,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0
+    ):
         """
         Args:
             primary_lm: Primary language model
             fallback_lm: Fallback language model
+            failure_threshold: Consecutive primary failures before the primary is skipped
+            cooldown: Time in seconds during which the primary is skipped
         """
         super().__init__()
         self.primary_lm = primary_lm
         self.fallback_lm = fallback_lm
         self.signature = TicketClassifier
+        # Built once; the LM is passed at call time (no settings context to
+        # enter). Separate instances so that each model keeps its own demos
+        # once optimized.
+        self.primary_predictor = dspy.ChainOfThought(self.signature)
+        self.fallback_predictor = dspy.ChainOfThought(self.signature)
+
+        # Circuit breaker state
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.primary_failures = 0
+        self.primary_cooldown_until = 0.0
+
+    def _fallback(self, ticket, model_used: str):
+        """Classify with the fallback model."""
+        try:
+            result = self.fallback_predictor(ticket=ticket, lm=self.fallback_lm)
+
+            return dspy.Prediction(
+                category=result.category,
+                priority=result.priority,
+                model_used=model_used
+            )
+
+        except Exception as fallback_error:
+            # Both models failed
+            raise Exception(f"Both models failed. Fallback error: {fallback_error}")
 
     def forward(self, ticket):
+        # Circuit open: the primary failed repeatedly, go straight to the fallback
+        if time.monotonic() < self.primary_cooldown_until:
+            return self._fallback(ticket, model_used='fallback-circuit-open')
+
         # Try primary model
         try:
-            with dspy.settings.context(lm=self.primary_lm):
-                predictor = dspy.ChainOfThought(self.signature)
-                result = predictor(ticket=ticket)
-
-                return dspy.Prediction(
-                    category=result.category,
-                    priority=result.priority,
-                    model_used='primary'
-                )
+            result = self.primary_predictor(ticket=ticket, lm=self.primary_lm)
 
         except Exception as e:
-            print(f"⚠️ Primary model failed: {e}")
-            print(f"   Switching to fallback model...")
+            logger.warning("Primary model failed: %s", e)
 
-            # Fallback to backup model
-            try:
-                with dspy.settings.context(lm=self.fallback_lm):
-                    predictor = dspy.ChainOfThought(self.signature)
-                    result = predictor(ticket=ticket)
+            self.primary_failures += 1
+            if self.primary_failures >= self.failure_threshold:
+                self.primary_cooldown_until = time.monotonic() + self.cooldown
+                logger.warning("Primary model skipped for the next %.0fs", self.cooldown)
 
-                    return dspy.Prediction(
-                        category=result.category,
-                        priority=result.priority,
-                        model_used='fallback'
-                    )
+            logger.warning("Switching to fallback model...")
+            return self._fallback(ticket, model_used='fallback')
 
-            except Exception as fallback_error:
-                # Both models failed
-                raise Exception(f"Both models failed. Fallback error: {fallback_error}")
+        self.primary_failures = 0
+        return dspy.Prediction(
+            category=result.category,
+            priority=result.priority,
+            model_used='primary'
+        )
 
 
 class EnsembleTicketClassifier(dspy.Module):
@@ -206,67 +295,371 @@ class EnsembleTicketClassifier(dspy.Module):
     Ensemble classifier using majority voting.
 
     Combines predictions from multiple models and returns the most common prediction.
+
+    All models are queried concurrently. With early_exit=True, they are
+    queried in two waves instead: first the heaviest models holding a strict
+    majority of the weight, then the others only if their votes could still
+    change the category or the priority. This saves LM calls when the first
+    wave agrees, at the cost of a second round trip when it does not.
     """
 
-    def __init__(self, models: List[Tuple[dspy.LM, int]]):
+    def __init__(self, models: List[Tuple[dspy.LM, int]], early_exit: bool = False):
         """
         Args:
             models: List of (language_model, weight) tuples
+            early_exit: Query the models in two waves and skip the second one
+                        when it cannot change the result
         """
         super().__init__()
-        self.models = models
         self.signature = TicketClassifier
+        # One predictor for all models; the LM is chosen per call
+        self.predictor = dspy.ChainOfThought(self.signature)
+
+        if not early_exit:
+            # A single wave with every model
+            self.models = list(models)
+            self.first_wave = len(self.models)
+            return
+
+        # Heaviest models first, so that the first wave is as small as possible
+        self.models = sorted(models, key=lambda model: model[1], reverse=True)
+
+        # First wave: smallest prefix of models holding a strict majority
+        total_weight = sum(weight for _, weight in self.models)
+        self.first_wave, majority_weight = 0, 0
+        while self.first_wave < len(self.models) and majority_weight * 2 <= total_weight:
+            majority_weight += self.models[self.first_wave][1]
+            self.first_wave += 1
+
+    def _query(self, ticket, models: List[Tuple[dspy.LM, int]]) -> List[Optional[dspy.Prediction]]:
+        """
+        Query models concurrently.
 
-    def forward(self, ticket):
-        predictions = []
-
-        # Get predictions from each model
-        for lm, weight in self.models:
+        Uses a plain thread pool rather than dspy.Parallel, whose progress
+        bookkeeping can crash when nested in dspy.Evaluate workers. Each task
+        gets a copy of the current context (dspy.context settings). A failing
+        model comes back as None without cancelling the others.
+        """
+        def ask(lm):
             try:
-                with dspy.settings.context(lm=lm):
-                    predictor = dspy.ChainOfThought(self.signature)
-                    result = predictor(ticket=ticket)
+                return self.predictor(ticket=ticket, lm=lm)
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(models)) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, ask, lm)
+                for lm, _ in models
+            ]
+            results = [future.result() for future in futures]
+        if None in results:
+            logger.warning("Error with %d model(s), skipping them", results.count(None))
+        return results
+
+    async def _aquery(self, ticket, models: List[Tuple[dspy.LM, int]]) -> List[Optional[dspy.Prediction]]:
+        """Async version of _query: one task per model on the running event loop."""
+        results = await asyncio.gather(
+            *(self.predictor.acall(ticket=ticket, lm=lm) for lm, _ in models),
+            return_exceptions=True
+        )
+        results = [None if isinstance(result, Exception) else result for result in results]
+        if None in results:
+            logger.warning("Error with %d model(s), skipping them", results.count(None))
+        return results
 
-                    # Add prediction with its weight
-                    for _ in range(weight):
-                        predictions.append({
-                            'category': result.category.strip().lower(),
-                            'priority': result.priority.strip().lower()
-                        })
+    @staticmethod
+    def _count_votes(waves_results) -> Tuple[Counter, Counter, int]:
+        """
+        Weighted vote: each model counts as many times as its weight.
 
-            except Exception as e:
-                print(f"⚠️ Error with a model: {e}")
-                continue
+        Args:
+            waves_results: List of (models, results) pairs, one per queried wave
 
-        if not predictions:
+        Returns:
+            (category_counts, priority_counts, total_weight) of the models that answered
+        """
+        category_counts = Counter()
+        priority_counts = Counter()
+        total_weight = 0
+        for wave, results in waves_results:
+            for result, (_, weight) in zip(results, wave):
+                if result is None:
+                    continue
+                category_counts[result.category.strip().lower()] += weight
+                priority_counts[result.priority.strip().lower()] += weight
+                total_weight += weight
+        return category_counts, priority_counts, total_weight
+
+    @staticmethod
+    def _has_winner(counts: Counter, remaining_weight: int) -> bool:
+        """Whether the remaining votes can no longer change the winner."""
+        (_, first), (_, second) = (counts.most_common(2) + [(None, 0), (None, 0)])[:2]
+        return first - second > remaining_weight
+
+    def _is_decided(self, waves_results, remaining_models: List[Tuple[dspy.LM, int]]) -> bool:
+        """Whether the remaining models cannot overturn the category or the priority vote."""
+        category_counts, priority_counts, _ = self._count_votes(waves_results)
+        remaining_weight = sum(weight for _, weight in remaining_models)
+        return (self._has_winner(category_counts, remaining_weight)
+                and self._has_winner(priority_counts, remaining_weight))
+
+    def _vote(self, waves_results) -> dspy.Prediction:
+        """Build the final prediction from the results of the queried waves."""
+        category_counts, priority_counts, answered_weight = self._count_votes(waves_results)
+
+        if not category_counts:
             raise Exception("No model could make a prediction")
 
-        # Majority vote for category
-        categories = [p['category'] for p in predictions]
-        category_counts = Counter(categories)
-        winning_category = category_counts.most_common(1)[0][0]
-
-        # Majority vote for priority
-        priorities = [p['priority'] for p in predictions]
-        priority_counts = Counter(priorities)
-        winning_priority = priority_counts.most_common(1)[0][0]
+        # Majority vote for category and priority
+        # (ties go to the first label seen, as with Counter.most_common)
+        winning_category = max(category_counts, key=category_counts.get)
+        winning_priority = max(priority_counts, key=priority_counts.get)
 
         # Normalize results
-        category = next((c for c in CATEGORIES if c.lower() == winning_category), winning_category)
-        priority = next((p for p in PRIORITIES if p.lower() == winning_priority), winning_priority)
-
-        # Calculate confidence (percentage of agreement)
-        category_confidence = category_counts[winning_category] / len(predictions)
-        priority_confidence = priority_counts[winning_priority] / len(predictions)
+        category = CATEGORY_BY_LC.get(winning_category, winning_category)
+        priority = PRIORITY_BY_LC.get(winning_priority, winning_priority)
+
+        # Calculate confidence (percentage of agreement). Models skipped by
+        # the early exit count as not agreeing, so that a vote decided by
+        # part of the ensemble is not reported as unanimous; models that
+        # failed are left out, as before.
+        queried_weight = sum(weight for wave, _ in waves_results for _, weight in wave)
+        skipped_weight = sum(weight for _, weight in self.models) - queried_weight
+        total_weight = answered_weight + skipped_weight
+        category_confidence = category_counts[winning_category] / total_weight
+        priority_confidence = priority_counts[winning_priority] / total_weight
 
         return dspy.Prediction(
             category=category,
             priority=priority,
             category_confidence=category_confidence,
             priority_confidence=priority_confidence,
-            num_models=len(self.models)
+            num_models=len(self.models),
+            models_queried=sum(len(wave) for wave, _ in waves_results)
         )
 
+    def forward(self, ticket):
+        first_wave, second_wave = self.models[:self.first_wave], self.models[self.first_wave:]
+
+        waves_results = [(first_wave, self._query(ticket, first_wave))]
+        if second_wave and not self._is_decided(waves_results, second_wave):
+            waves_results.append((second_wave, self._query(ticket, second_wave)))
+
+        return self._vote(waves_results)
+
+    async def aforward(self, ticket):
+        """
+        Async version of forward, used by `await ensemble.acall(ticket=...)`.
+
+        The models of a wave run as tasks on the event loop instead of
+        threads, which scales better to large ensembles.
+        """
+        first_wave, second_wave = self.models[:self.first_wave], self.models[self.first_wave:]
+
+        waves_results = [(first_wave, await self._aquery(ticket, first_wave))]
+        if second_wave and not self._is_decided(waves_results, second_wave):
+            waves_results.append((second_wave, await self._aquery(ticket, second_wave)))
+
+        return self._vote(waves_results)
+
+
+@lru_cache(maxsize=None)
+def _load_encoder(model_name: str):
+    """
+    Load a sentence-transformers model on first use (None if not installed).
+
+    sentence-transformers is optional: without it, TicketCache only serves
+    exact matches.
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return None
+    return SentenceTransformer(model_name)
+
+
+# DSPy's global trace list. The default config already has trace=[], so a
+# non-None trace alone does not mean that an optimizer is recording
+_GLOBAL_TRACE = dspy.settings.trace
+
+
+def _recording_trace() -> bool:
+    """
+    Whether an optimizer is recording a trace around the current call.
+
+    Optimizers bootstrap demos inside dspy.context(trace=[]), which replaces
+    the global trace list with a fresh one for the duration of the run.
+    """
+    trace = dspy.settings.trace
+    return trace is not None and trace is not _GLOBAL_TRACE
+
+
+def _lm_identity() -> str:
+    """Identity of the active LM (model and kwargs, e.g. temperature)."""
+    lm = dspy.settings.lm
+    if lm is None:
+        return ''
+    return f"{lm.model}|{sorted(lm.kwargs.items())!r}"
+
+
+class TicketCache:
+    """
+    Cache of predictions keyed by ticket text and by the active LM.
+
+    Exact tier: tickets are normalized (surrounding spaces, case) and looked
+    up in a bounded LRU dictionary. Semantic tier (optional): when
+    similarity_threshold is set and sentence-transformers is installed, a
+    miss falls back to the cached ticket with the most similar embedding,
+    if its cosine similarity reaches the threshold.
+
+    Each LM (model and kwargs) has its own entries, so a prediction made
+    under dspy.context(lm=...) is never served for another LM.
+
+    Thread-safe, so it can be used under dspy.Parallel and dspy.Evaluate.
+    Copies (e.g. the program an optimizer compiles) start with an empty cache.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 4096,
+        similarity_threshold: Optional[float] = None,
+        encoder_name: str = 'sentence-transformers/all-MiniLM-L6-v2'
+    ):
+        """
+        Args:
+            maxsize: Maximum number of cached tickets (least recently used
+                     ones are evicted first)
+            similarity_threshold: Minimum cosine similarity for a semantic
+                                  hit (e.g. 0.92). None: exact matches only
+            encoder_name: sentence-transformers model for the semantic tier
+        """
+        self.maxsize = maxsize
+        self.similarity_threshold = similarity_threshold
+        self.encoder_name = encoder_name
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], dspy.Prediction] = OrderedDict()
+        # Semantic tier: one normalized embedding per cached ticket, stacked
+        # into one matrix per LM on the first lookup after a change
+        self._vectors: Dict[Tuple[str, str], np.ndarray] = {}
+        self._index: Dict[str, Tuple[List[Tuple[str, str]], np.ndarray]] = {}
+
+    def __deepcopy__(self, memo):
+        # Predictions made by the original program are not valid for a copy
+        # that is about to be optimized
+        return TicketCache(self.maxsize, self.similarity_threshold, self.encoder_name)
+
+    @staticmethod
+    def _key(ticket: str) -> Tuple[str, str]:
+        return _lm_identity(), ticket.strip().lower()
+
+    def _encode(self, key: Tuple[str, str]) -> Optional[np.ndarray]:
+        """Normalized embedding of a ticket (None when the semantic tier is off)."""
+        if self.similarity_threshold is None:
+            return None
+        encoder = _load_encoder(self.encoder_name)
+        if encoder is None:
+            return None
+        return encoder.encode([key[1]], normalize_embeddings=True)[0]
+
+    def get(self, ticket: str) -> Optional[dspy.Prediction]:
+        """Return the cached prediction for a ticket (None on a miss)."""
+        key = self._key(ticket)
+        with self._lock:
+            prediction = self._entries.get(key)
+            if prediction is not None:
+                self._entries.move_to_end(key)
+                return prediction
+            if not self._vectors:
+                return None
+
+        # Encoding is slow: done outside the lock
+        query = self._encode(key)
+        if query is None:
+            return None
+
+        lm_identity = key[0]
+        with self._lock:
+            if lm_identity not in self._index:
+                keys = [k for k in self._vectors if k[0] == lm_identity]
+                if not keys:
+                    return None
+                self._index[lm_identity] = (keys, np.vstack([self._vectors[k] for k in keys]))
+            keys, matrix = self._index[lm_identity]
+
+            # Embeddings are normalized, so the dot product is the cosine similarity
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                return self._entries.get(keys[best])
+            return None
+
+    def put(self, ticket: str, prediction: dspy.Prediction):
+        """Store the prediction for a ticket."""
+        key = self._key(ticket)
+        vector = self._encode(key)
+
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.maxsize:
+                # Evict the least recently used ticket
+                evicted, _ = self._entries.popitem(last=False)
+                if self._vectors.pop(evicted, None) is not None:
+                    self._index.pop(evicted[0], None)
+            self._entries[key] = prediction
+            self._entries.move_to_end(key)
+
+            if vector is not None:
+                self._vectors[key] = vector
+                self._index.pop(key[0], None)
+
+    def clear(self):
+        """Remove every cached prediction."""
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+            self._index.clear()
+
+
+class CachedTicketClassifier(dspy.Module):
+    """
+    Classifier that answers repeated tickets from a TicketCache.
+
+    Only cache misses reach the wrapped classifier (and the LM). Works with
+    any of the classifiers above, e.g. CachedTicketClassifier(ValidatedTicketClassifier()).
+
+    The cache is bypassed while an optimizer records traces, so that every
+    call shows up in the trace. It is cleared by load() / load_state(); after
+    changing the wrapped classifier in place (demos, instructions), call
+    cache.clear() so that its old predictions are not served.
+    """
+
+    def __init__(self, classifier: dspy.Module, cache: Optional[TicketCache] = None):
+        """
+        Args:
+            classifier: The classifier called on cache misses
+            cache: Cache to use (default: a new exact-match TicketCache)
+        """
+        super().__init__()
+        self.classifier = classifier
+        self.cache = cache if cache is not None else TicketCache()
+
+    def load_state(self, state):
+        # Predictions of the previous program state are stale
+        result = super().load_state(state)
+        self.cache.clear()
+        return result
+
+    def forward(self, ticket):
+        if _recording_trace():
+            return self.classifier(ticket=ticket)
+
+        hit = self.cache.get(ticket)
+        if hit is not None:
+            return hit
+
+        result = self.classifier(ticket=ticket)
+        self.cache.put(ticket, result)
+        return result
+
 
 if __name__ == "__main__":
     # Example usage
@@ -3,10 +3,21 @@ DSPy Signatures module.
 
 This module contains all signature definitions for the IT ticket classification task.
 Signatures define the input-output contract for DSPy modules.
+
+The allowed labels are listed in the output field descriptions. DSPy puts
+field descriptions and instructions in the system message and the ticket in
+the last user message, so every call shares the same prompt prefix and
+servers with prefix caching (Ollama, vLLM, OpenAI, ...) only process the
+ticket. Keeping the labels out of the docstring also means that optimizers
+which rewrite the instructions (GEPA, MIPROv2) cannot drop them.
 """
 
 import dspy
-from data import CATEGORIES, PRIORITIES
+from data import CATEGORIES_DESC, PRIORITIES_DESC
+
+# Output field descriptions shared by the classification signatures
+CATEGORY_FIELD_DESC = f"Category among: {CATEGORIES_DESC}"
+PRIORITY_FIELD_DESC = f"Priority among: {PRIORITIES_DESC}"
 
 
 class BasicSignature(dspy.Signature):
@@ -27,8 +38,8 @@ class ConstrainedSignature(dspy.Signature):
     """Classify an IT ticket by category and priority."""
 
     ticket = dspy.InputField(desc="IT support ticket description")
-    category = dspy.OutputField(desc=f"Category among: {', '.join(CATEGORIES)}")
-    priority = dspy.OutputField(desc=f"Priority among: {', '.join(PRIORITIES)}")
+    category = dspy.OutputField(desc=CATEGORY_FIELD_DESC)
+    priority = dspy.OutputField(desc=PRIORITY_FIELD_DESC)
 
 
 class ContextualSignature(dspy.Signature):
@@ -36,8 +47,8 @@ class ContextualSignature(dspy.Signature):
 
     ticket = dspy.InputField(desc="Current issue description")
     user_history = dspy.InputField(desc="User's previous ticket history")
-    category = dspy.OutputField(desc=f"Category among: {', '.join(CATEGORIES)}")
-    priority = dspy.OutputField(desc=f"Priority among: {', '.join(PRIORITIES)}")
+    category = dspy.OutputField(desc=CATEGORY_FIELD_DESC)
+    priority = dspy.OutputField(desc=PRIORITY_FIELD_DESC)
     reasoning = dspy.OutputField(desc="Explanation of the decision")
 
 
@@ -55,15 +66,15 @@ class TicketClassifier(dspy.Signature):
     """Classify an IT support ticket by category and priority."""
 
     ticket = dspy.InputField(desc="IT support ticket description")
-    category = dspy.OutputField(desc=f"Category among: {', '.join(CATEGORIES)}")
-    priority = dspy.OutputField(desc=f"Priority among: {', '.join(PRIORITIES)}")
+    category = dspy.OutputField(desc=CATEGORY_FIELD_DESC)
+    priority = dspy.OutputField(desc=PRIORITY_FIELD_DESC)
 
 
 class CategoryClassifier(dspy.Signature):
     """Determine the technical category of an IT ticket."""
 
     ticket = dspy.InputField(desc="Ticket description")
-    category = dspy.OutputField(desc=f"Category among: {', '.join(CATEGORIES)}")
+    category = dspy.OutputField(desc=CATEGORY_FIELD_DESC)
 
 
 class PriorityClassifier(dspy.Signature):
@@ -71,7 +82,15 @@ class PriorityClassifier(dspy.Signature):
 
     ticket = dspy.InputField(desc="Ticket description")
     category = dspy.InputField(desc="Technical category already identified")
-    priority = dspy.OutputField(desc=f"Priority among: {', '.join(PRIORITIES)}")
+    priority = dspy.OutputField(desc=PRIORITY_FIELD_DESC)
+
+
+class BatchClassifier(dspy.Signature):
+    """Classify several IT support tickets by category and priority, returning one label per ticket in the same order."""
+
+    tickets: list[str] = dspy.InputField(desc="IT support ticket descriptions")
+    categories: list[str] = dspy.OutputField(desc=f"One category per ticket, among: {CATEGORIES_DESC}")
+    priorities: list[str] = dspy.OutputField(desc=f"One priority per ticket, among: {PRIORITIES_DESC}")
 
 
 if __name__ == "__main__":
@@ -85,3 +104,4 @@ if __name__ == "__main__":
     print("6. TicketClassifier - Main signature (recommended)")
     print("7. CategoryClassifier - Category only")
     print("8. PriorityClassifier - Priority with category context")
+    print("9. BatchClassifier - Several tickets in one call")
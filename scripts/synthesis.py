@@ -15,9 +15,9 @@ import dspy
 from config import configure_ollama
 from modules import SimpleTicketClassifier, ValidatedClassifier, SequentialClassifier
 from data import get_train_examples, get_val_examples
-from metrics import exact_match_metric, partial_match_metric
+from metrics import exact_match_metric, partial_match_metric, relative_improvement, batch_scores
 from optimizers import optimize_with_bootstrap, inspect_optimized_demos
-from evaluation import evaluate_module
+from evaluation import evaluate_module, compare_modules
 
 
 def print_section(title: str):
@@ -78,13 +78,20 @@ def run_complete_pipeline():
         "SequentialClassifier": SequentialClassifier()
     }
 
-    baseline_scores = {}
     print("\nEvaluating baseline modules on validation set...\n")
 
-    for name, module in modules.items():
+    # The three modules are evaluated in a single parallel run
+    comparison = compare_modules(
+        list(modules.items()),
+        valset,
+        {'exact_match': exact_match_metric},
+        keep_predictions=True
+    )
+    baseline_scores = {result['module']: result['exact_match'] for result in comparison}
+    baseline_predictions = {result['module']: result['predictions'] for result in comparison}
+
+    for name, score in baseline_scores.items():
         print(f"Testing {name}...")
-        score = evaluate_module(module, valset, exact_match_metric)
-        baseline_scores[name] = score
         print(f"   Score: {score:.2%}\n")
 
     # Select best baseline
@@ -98,13 +105,8 @@ def run_complete_pipeline():
     # =========================================================================
     print_section("Step 4: Optimization with BootstrapFewShot")
 
-    # Create fresh instance of best baseline
-    if best_baseline_name == "SimpleTicketClassifier":
-        module_to_optimize = SimpleTicketClassifier()
-    elif best_baseline_name == "ValidatedClassifier":
-        module_to_optimize = ValidatedClassifier()
-    else:
-        module_to_optimize = SequentialClassifier()
+    # Reuse the best baseline: the optimizer compiles a copy of it
+    module_to_optimize = modules[best_baseline_name]
 
     print(f"\n🔧 Optimizing {best_baseline_name}...")
     print(f"⏱️ This will take ~30 seconds...\n")
@@ -128,7 +130,7 @@ def run_complete_pipeline():
     print(f"   Baseline ({best_baseline_name}): {best_baseline_score:.2%}")
     print(f"   Optimized: {optimized_score:.2%}")
 
-    improvement = ((optimized_score - best_baseline_score) / best_baseline_score * 100) if best_baseline_score > 0 else 0
+    improvement = relative_improvement(best_baseline_score, optimized_score)
     print(f"   Improvement: {improvement:+.1f}%")
 
     # Show demonstration examples
@@ -140,42 +142,44 @@ def run_complete_pipeline():
     # =========================================================================
     print_section("Step 6: Detailed Comparison on Validation Set")
 
-    # Recreate baseline for comparison
-    if best_baseline_name == "SimpleTicketClassifier":
-        baseline_fresh = SimpleTicketClassifier()
-    elif best_baseline_name == "ValidatedClassifier":
-        baseline_fresh = ValidatedClassifier()
-    else:
-        baseline_fresh = SequentialClassifier()
-
     print(f"\nComparing predictions on each validation example:\n")
 
-    baseline_correct = 0
-    optimized_correct = 0
-
-    for i, example in enumerate(valset, 1):
+    # The baseline predictions from Step 3 are reused; only the optimized
+    # module is run, in parallel, before the report
+    # (failed predictions come back as None and are shown as empty labels)
+    parallel = dspy.Parallel(num_threads=8, disable_progress_bar=True)
+    optimized_preds = parallel([(optimized, example.inputs()) for example in valset])
+
+    def or_empty(predictions):
+        return [
+            prediction if prediction is not None else dspy.Prediction(category="", priority="")
+            for prediction in predictions
+        ]
+
+    baseline_preds = or_empty(baseline_predictions[best_baseline_name])
+    optimized_preds = or_empty(optimized_preds)
+
+    # Exact-match scores for both modules, computed in one vectorized pass each
+    baseline_matches, _ = batch_scores(valset, baseline_preds)
+    optimized_matches, _ = batch_scores(valset, optimized_preds)
+    baseline_correct = int(baseline_matches.sum())
+    optimized_correct = int(optimized_matches.sum())
+
+    for i, (example, baseline_pred, optimized_pred, baseline_match, optimized_match) in enumerate(
+        zip(valset, baseline_preds, optimized_preds, baseline_matches, optimized_matches), 1
+    ):
         print(f"--- Example {i} ---")
         print(f"Ticket: {example.ticket[:60]}...")
         print(f"Expected: {example.category} / {example.priority}")
 
         # Baseline prediction
-        baseline_pred = baseline_fresh(ticket=example.ticket)
-        baseline_match = exact_match_metric(example, baseline_pred)
         baseline_status = "✅" if baseline_match == 1.0 else "❌"
         print(f"Baseline:  {baseline_pred.category} / {baseline_pred.priority} {baseline_status}")
 
         # Optimized prediction
-        optimized_pred = optimized(ticket=example.ticket)
-        optimized_match = exact_match_metric(example, optimized_pred)
         optimized_status = "✅" if optimized_match == 1.0 else "❌"
         print(f"Optimized: {optimized_pred.category} / {optimized_pred.priority} {optimized_status}")
 
-        # Track scores
-        if baseline_match == 1.0:
-            baseline_correct += 1
-        if optimized_match == 1.0:
-            optimized_correct += 1
-
         # Highlight changes
         if baseline_pred.category != optimized_pred.category or baseline_pred.priority != optimized_pred.priority:
             if baseline_match == 1.0 and optimized_match == 0.0:
@@ -272,7 +276,7 @@ def run_quick_demo():
     print(f"\n{'='*50}")
     print(f"Baseline:  {baseline_score:.2%}")
     print(f"Optimized: {optimized_score:.2%}")
-    improvement = ((optimized_score - baseline_score) / baseline_score * 100) if baseline_score > 0 else 0
+    improvement = relative_improvement(baseline_score, optimized_score)
     print(f"Change:    {improvement:+.1f}%")
     print(f"{'='*50}\n")
 
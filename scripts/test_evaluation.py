@@ -0,0 +1,43 @@
+"""
+Tests for the streaming evaluation (run with `python -m pytest` from scripts/).
+
+The LM stream is mocked at the litellm level, so no server is needed.
+"""
+
+from unittest import mock
+
+import dspy
+from litellm.types.utils import Delta, ModelResponseStream, StreamingChoices
+
+from evaluation import evaluate_exact_match_streaming
+from modules import SimpleTicketClassifier
+
+# ChatAdapter output for category 'Hardware' and priority 'Urgent', in small chunks
+_CHUNKS = [
+    "[[", " ##", " category", " ##", " ]]", "\n\n", "Hard", "ware", "\n\n",
+    "[[", " ##", " priority", " ##", " ]]", "\n\n", "Urgent", "\n\n",
+    "[[", " ##", " completed", " ##", " ]]",
+]
+
+
+async def _mock_stream(*args, **kwargs):
+    for content in _CHUNKS:
+        yield ModelResponseStream(
+            model="openai/gpt-4o-mini",
+            choices=[StreamingChoices(delta=Delta(content=content))]
+        )
+
+
+def test_streaming_exact_match_scores_right_and_wrong_categories():
+    dataset = [
+        {"ticket": "Mon écran reste noir.", "category": "Hardware", "priority": "Urgent"},
+        {"ticket": "Excel plante au démarrage.", "category": "Software", "priority": "Urgent"},
+    ]
+    lm = dspy.LM("openai/gpt-4o-mini", cache=False)
+
+    with mock.patch("litellm.acompletion", side_effect=_mock_stream):
+        with dspy.context(lm=lm, adapter=dspy.ChatAdapter()):
+            score = evaluate_exact_match_streaming(SimpleTicketClassifier(use_cot=False), dataset)
+
+    # The first example matches exactly, the second has a wrong category
+    assert score == 0.5